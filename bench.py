@@ -0,0 +1,560 @@
+"""
+Benchmarks du modèle de MyPharmApp.
+
+Usage : python bench.py [--no-history] [nom_du_benchmark ...]
+Sans nom, tous les benchmarks sont lancés, sauf "gui" (interface Tk, à demander explicitement ;
+il utilise l'affichage courant ou un serveur X virtuel Xvfb).
+
+Chaque benchmark retourne ses mesures (secondes par opération ou octets : plus petit = meilleur).
+Elles sont ajoutées à bench_history.json et comparées au lancement précédent : une mesure
+plus lente de plus de REGRESSION_THRESHOLD est signalée.
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+
+from script import (Day, DeliveryInfo, Medicine, Pharmacy, PartnersSet, Cart, OrderService, AvailabilityIndex, AvailabilityPlanner,
+                    CatalogUpdater, StockLedger, OrderLineStore,
+                    OrderJournal, GeoIndex, distance_km, export_tickets, fake_pharmacies, generate_network)
+
+HISTORY_PATH = "bench_history.json"
+REGRESSION_THRESHOLD = 0.20
+
+
+def _timeit(func, repeat):
+    """Retourne le temps moyen (en secondes) d'un appel à func."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+# 1. Recherche des partenaires disponibles par jour
+def bench_partners():
+    rng = random.Random(42)
+    results = {}
+    for n in (10_000, 100_000):
+        pharmacies = generate_network(n, 200, seed=n, median_catalog_size=5)
+        partner_set = PartnersSet(pharmacies)
+        lookups = [rng.choice(list(Day)) for _ in range(50)]
+
+        def scan():
+            for day in lookups:
+                [p for p in pharmacies if day in p.get_open_days()]
+
+        def index():
+            for day in lookups:
+                partner_set.update_available_by_day(day)
+
+        t_scan = _timeit(scan, 3) / len(lookups)
+        index()  # construit les vues par jour une première fois
+        t_index = _timeit(index, 3) / len(lookups)
+        print(f"partners n={n:>7}: scan {t_scan * 1e3:8.3f} ms/lookup, "
+              f"index {t_index * 1e6:8.3f} µs/lookup (x{t_scan / t_index:,.0f})")
+        results[f"update_available_by_day_{n}"] = t_index
+    return results
+
+
+# 2. Traitement de commandes en lot (sans interface)
+def _order_requests(n, rng):
+    # Carnot est ouverte tous les jours : toutes les commandes sont valides
+    carnot = fake_pharmacies()[3]
+    names = [med.get_name() for med in carnot.get_catalog()]
+    dates = [f"{d:02d}/03/2025" for d in range(1, 32)]
+    return [
+        {'name': "Martin", 'first_name': "Alice", 'date': rng.choice(dates),
+         'items': [(carnot.get_name(), rng.choice(names), rng.randint(1, 3)) for _ in range(rng.randint(1, 4))]}
+        for _ in range(n)
+    ]
+
+def bench_orders(n=200_000):
+    service = OrderService(PartnersSet(fake_pharmacies()))
+    requests = _order_requests(n, random.Random(42))
+    start = time.perf_counter()
+    ok = sum(result['ok'] for result in service.process_orders(requests))
+    elapsed = time.perf_counter() - start
+    print(f"orders n={n}: {n / elapsed:,.0f} commandes/s ({ok} valides)")
+    return {"process_order": elapsed / n}
+
+
+# 3. Calcul du jour de livraison à partir de la date
+def bench_dates(n=1_000_000):
+    rng = random.Random(42)
+    dates = [f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2024, 2026)}" for _ in range(300)]
+    rows = [rng.choice(dates) for _ in range(n)]
+    deliv_info = DeliveryInfo()
+
+    start = time.perf_counter()
+    [Day(datetime.strptime(row, "%d/%m/%Y").weekday()) for row in rows[:n // 10]]
+    t_strptime = (time.perf_counter() - start) / (n // 10)
+    start = time.perf_counter()
+    [deliv_info.compute_day(row) for row in rows]
+    t_compute = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    DeliveryInfo.compute_days(rows)
+    t_bulk = (time.perf_counter() - start) / n
+    print(f"dates n={n}: strptime {t_strptime * 1e9:6.0f} ns/date, compute_day {t_compute * 1e9:6.0f} ns/date, "
+          f"compute_days {t_bulk * 1e9:6.0f} ns/date")
+    return {"compute_day": t_compute, "compute_days": t_bulk}
+
+
+# 4. Mémoire occupée par le modèle
+class _DictMedicine:
+    """Représentation d'origine (attributs dans un __dict__), pour comparaison."""
+    def __init__(self, name, description, price):
+        self._name = name
+        self._description = description
+        self._price = price
+
+class _DictPharmacy:
+    def __init__(self, name, description, open_days, catalog):
+        self._name = name
+        self._description = description
+        self._open_days = open_days
+        self._catalog = catalog
+        self._partner_sets = []
+
+def _measure(build):
+    tracemalloc.start()
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size
+
+def bench_memory(n_pharmacies=20_000, n_medicines=30_000, catalog_size=50):
+    rng = random.Random(42)
+    days = list(Day)
+    rows = [(f"Médicament {i}", f"Description du médicament {i}", rng.randint(100, 5000) / 100)
+            for i in range(n_medicines)]
+    pharmacy_rows = [(f"Pharmacie {i}", f"{i} Rue du test", rng.sample(days, rng.randint(1, 7)),
+                      rng.sample(range(n_medicines), catalog_size)) for i in range(n_pharmacies)]
+
+    results = {}
+    for label, medicine_class in (("dict", _DictMedicine), ("slots", Medicine)):
+        size = _measure(lambda: [medicine_class(*row) for row in rows])
+        print(f"memory {label:>5}: {size / n_medicines:6.0f} octets/médicament")
+        results[f"bytes_per_medicine_{label}"] = size / n_medicines
+
+    def build_dict():
+        meds = [_DictMedicine(*row) for row in rows]
+        return meds, [_DictPharmacy(name, desc, list(open_days), [meds[i] for i in catalog])
+                      for name, desc, open_days, catalog in pharmacy_rows]
+
+    def build_slots():
+        meds = [Medicine(*row) for row in rows]
+        return meds, [Pharmacy(name, desc, open_days, [meds[i] for i in catalog])
+                      for name, desc, open_days, catalog in pharmacy_rows]
+
+    base = _measure(lambda: [_DictMedicine(*row) for row in rows])
+    size = _measure(build_dict) - base
+    print(f"memory  dict: {size / n_pharmacies:6.0f} octets/pharmacie ({catalog_size} médicaments au catalogue)")
+    results["bytes_per_pharmacy_dict"] = size / n_pharmacies
+    base = _measure(lambda: [Medicine(*row) for row in rows])
+    size = _measure(build_slots) - base
+    print(f"memory slots: {size / n_pharmacies:6.0f} octets/pharmacie ({catalog_size} médicaments au catalogue)")
+    results["bytes_per_pharmacy_slots"] = size / n_pharmacies
+    return results
+
+
+# 5. « Qui propose X ce jour-là, du moins cher au plus cher »
+def bench_offers(n_pharmacies=20_000, n_medicines=2_000):
+    rng = random.Random(42)
+    pharmacies = generate_network(n_pharmacies, n_medicines, seed=42, median_catalog_size=50, price_spread=0.2)
+    availability = AvailabilityIndex(PartnersSet(pharmacies))
+    names = list({med.get_name() for pharmacy in pharmacies[:200] for med in pharmacy.get_catalog()})
+    start = time.perf_counter()
+    availability.cheapest_offers(names[0], Day.Monday)
+    print(f"offers n={n_pharmacies}: construction de l'index {time.perf_counter() - start:.2f} s")
+    queries = [(rng.choice(names), rng.choice(list(Day))) for _ in range(2_000)]
+    t_first = _timeit(lambda: [availability.cheapest_offers(name, day) for name, day in queries], 1) / len(queries)
+    t_cached = _timeit(lambda: [availability.cheapest_offers(name, day) for name, day in queries], 5) / len(queries)
+    print(f"offers n={n_pharmacies}: {t_first * 1e6:.1f} µs/requête (premier appel), {t_cached * 1e6:.2f} µs/requête (en cache)")
+    return {"cheapest_offers_first": t_first, "cheapest_offers_cached": t_cached}
+
+
+# 6. Export des tickets en lot
+def bench_export(n=100_000):
+    requests = _order_requests(n, random.Random(42))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in ("txt", "csv", "json"):
+            path = os.path.join(directory, f"tickets.{fmt}")
+            stats = export_tickets(requests, path)
+            print(f"export {fmt:>4} n={n}: {stats['tickets_per_second']:,.0f} tickets/s "
+                  f"({os.path.getsize(path) / 1e6:.1f} Mo)")
+            results[f"export_{fmt}"] = 1 / stats['tickets_per_second']
+    return results
+
+
+# 7. Journal des commandes selon la durabilité
+def bench_journal(n=20_000, threads=8):
+    requests = _order_requests(n, random.Random(42))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for durability in ("none", "group", "always"):
+            count = n if durability != "always" else n // 10
+            journal = OrderJournal(os.path.join(directory, f"{durability}.journal"), durability)
+            per_thread = count // threads
+
+            def place(first):
+                for request in requests[first:first + per_thread]:
+                    journal.append(request)
+
+            workers = [threading.Thread(target=place, args=(i * per_thread,)) for i in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            journal.flush()
+            elapsed = time.perf_counter() - start
+            journal.close()
+            print(f"journal {durability:>6} ({threads} threads): {per_thread * threads / elapsed:,.0f} commandes/s")
+            results[f"journal_{durability}"] = elapsed / (per_thread * threads)
+    return results
+
+
+# 8. Panier : ajout et retrait
+def bench_cart(n=500_000):
+    pharmacies = generate_network(50, 2_000, seed=8)
+    rng = random.Random(8)
+    lines = [(pharmacy.get_name(), rng.choice(pharmacy.get_catalog())) for pharmacy in rng.choices(pharmacies, k=200)]
+    ops = [rng.choice(lines) for _ in range(n)]
+    cart = Cart()
+    t_add = _timeit(lambda: [cart.add_to_cart(med, pharm_name) for pharm_name, med in ops], 1) / n
+    t_remove = _timeit(lambda: [cart.remove_from_cart(med, pharm_name) for pharm_name, med in ops], 1) / n
+    print(f"cart n={n}: add_to_cart {t_add * 1e9:5.0f} ns, remove_from_cart {t_remove * 1e9:5.0f} ns "
+          f"(panier de {len(lines)} lignes)")
+    return {"cart_add": t_add, "cart_remove": t_remove}
+
+
+# 9. Rendu des tickets
+def bench_tickets(n=50_000):
+    service = OrderService(PartnersSet(fake_pharmacies()))
+    orders = [service.build_order(request) for request in _order_requests(n, random.Random(9))]
+    t_lines = _timeit(lambda: [service.build_ticket_lines(deliv_info, cart) for deliv_info, cart in orders], 1) / n
+    t_json = _timeit(lambda: [service.render_ticket(deliv_info, cart, "json") for deliv_info, cart in orders], 1) / n
+    print(f"tickets n={n}: build_ticket_lines {t_lines * 1e6:5.1f} µs, render_ticket(json) {t_json * 1e6:5.1f} µs")
+    return {"build_ticket_lines": t_lines, "render_ticket_json": t_json}
+
+
+# 10. Interface : affichage des médicaments et du panier (sous Xvfb si pas d'affichage)
+def _start_xvfb():
+    if os.environ.get("DISPLAY"):
+        return None
+    if shutil.which("Xvfb") is None:
+        return False
+    display = ":99"
+    process = subprocess.Popen(["Xvfb", display, "-screen", "0", "1280x1024x24"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    os.environ["DISPLAY"] = display
+    return process
+
+def bench_gui():
+    xvfb = _start_xvfb()
+    if xvfb is False:
+        print("gui: ni affichage (DISPLAY) ni Xvfb disponible, benchmark ignoré")
+        return {}
+    import tkinter as tk
+    from script import MyPharmApp
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            root = tk.Tk()
+            app = MyPharmApp(root, journal_path=os.path.join(directory, "commandes.journal"))
+            root.update()
+            for size in (100, 1_000, 10_000):
+                pharmacy = generate_network(1, size, seed=size, median_catalog_size=size)[0]
+
+                def display():
+                    app._show_medicines(app._filter_catalog(pharmacy, "", None, None))
+                    root.update_idletasks()
+
+                t_display = _timeit(display, 5)
+                print(f"gui update_medicines_display catalogue={len(pharmacy.get_catalog()):>6}: {t_display * 1e3:7.2f} ms")
+                results[f"update_medicines_display_{size}"] = t_display
+
+                meds = list(pharmacy.get_catalog()[:1_000])
+                start = time.perf_counter()
+                for med in meds:
+                    app._cart.add_to_cart(med, pharmacy.get_name())
+                    app.schedule_cart_repaint(pharmacy.get_name(), med.get_name())
+                root.update_idletasks()
+                t_cart = (time.perf_counter() - start) / len(meds)
+                print(f"gui schedule_cart_repaint panier={len(meds):>6} lignes: {t_cart * 1e3:7.3f} ms/ajout")
+                results[f"cart_repaint_{len(meds)}"] = t_cart
+                for med in meds:
+                    app._cart.set_quantity(med, 0, pharmacy.get_name())
+                app.schedule_cart_repaint()
+                root.update_idletasks()
+            app.on_close()
+    finally:
+        if xvfb:
+            xvfb.terminate()
+    return results
+
+
+# 11. Pharmacies ouvertes les plus proches (index spatial)
+def bench_geo(n_pharmacies=100_000, n_medicines=2_000):
+    rng = random.Random(12)
+    pharmacies = generate_network(n_pharmacies, n_medicines, seed=12, median_catalog_size=20)
+    partner_set = PartnersSet(pharmacies)
+    availability = AvailabilityIndex(partner_set)
+    geo_index = GeoIndex(partner_set, availability)
+    points = [(rng.uniform(43.0, 50.5), rng.uniform(-1.5, 7.0)) for _ in range(500)]
+    names = [med.get_name() for med in pharmacies[0].get_catalog()[:2]]
+    geo_index.nearest(points[0], 5, Day.Monday, names)  # construit les index une première fois
+
+    def scan():
+        for point in points[:20]:
+            sorted((distance_km(point, p.get_location()), i) for i, p in enumerate(partner_set.get_partners_by_day(Day.Monday)))[:5]
+
+    t_scan = _timeit(scan, 1) / 20
+    t_day = _timeit(lambda: [geo_index.nearest(point, 5, Day.Monday) for point in points], 1) / len(points)
+    t_meds = _timeit(lambda: [geo_index.nearest(point, 5, Day.Monday, names) for point in points], 1) / len(points)
+    print(f"geo n={n_pharmacies}: tri complet {t_scan * 1e3:.1f} ms, 5 plus proches ouvertes {t_day * 1e3:.3f} ms, "
+          f"avec {len(names)} médicaments {t_meds * 1e3:.3f} ms")
+    return {"nearest_open": t_day, "nearest_open_stocking": t_meds}
+
+
+# 12. Planification sur plusieurs semaines (NumPy)
+def bench_planner(n_pharmacies=100_000, n_medicines=2_000, n_baskets=1_000):
+    rng = random.Random(13)
+    pharmacies = generate_network(n_pharmacies, n_medicines, seed=13, median_catalog_size=30)
+    planner = AvailabilityPlanner(PartnersSet(pharmacies))
+    start = time.perf_counter()
+    planner.get_pharmacies()
+    print(f"planner n={n_pharmacies}: construction des matrices {time.perf_counter() - start:.2f} s")
+    names = list({med.get_name() for pharmacy in pharmacies[:500] for med in pharmacy.get_catalog()})
+    baskets = [rng.sample(names, rng.randint(1, 5)) for _ in range(n_baskets)]
+    today = date(2026, 1, 5)
+    t_next = _timeit(lambda: planner.next_open_dates(today, 42), 3)
+    t_network = _timeit(lambda: planner.first_full_dates(baskets, today, 42), 1) / n_baskets
+    t_single = _timeit(lambda: planner.first_full_dates(baskets, today, 42, single_pharmacy=True), 1) / n_baskets
+    print(f"planner n={n_pharmacies}: prochaine ouverture de chaque pharmacie {t_next * 1e3:.1f} ms, "
+          f"première date par panier {t_network * 1e6:.0f} µs (réseau), {t_single * 1e6:.0f} µs (une seule pharmacie)")
+    return {"next_open_dates": t_next, "first_full_date": t_network, "first_full_date_single": t_single}
+
+
+# 13. Mises à jour du fournisseur (prix, catalogue, jours d'ouverture)
+def bench_deltas(n_pharmacies=20_000, n_medicines=2_000, n_deltas=5_000):
+    rng = random.Random(14)
+    pharmacies = generate_network(n_pharmacies, n_medicines, seed=14, median_catalog_size=50)
+    partner_set = PartnersSet(pharmacies)
+    availability = AvailabilityIndex(partner_set)
+    updater = CatalogUpdater(partner_set, (availability,))
+    partner_set.update_available_by_day(Day.Monday)
+    availability.medicine_names()  # construit l'index une première fois
+    deltas = []
+    for version, pharmacy in enumerate(rng.choices(pharmacies, k=n_deltas), 1):
+        catalog = pharmacy.get_catalog()
+        delta = {'pharmacy': pharmacy.get_name(), 'version': version,
+                 'prices': {med.get_name(): round(med.get_price() * 1.05, 2) for med in rng.sample(list(catalog), min(3, len(catalog)))}}
+        if version % 10 == 0:
+            delta['open_days'] = [day.name for day in rng.sample(list(Day), rng.randint(1, 7))]
+        deltas.append(delta)
+    t_delta = _timeit(lambda: updater.apply_all(deltas), 1) / n_deltas
+    t_rebuild = _timeit(lambda: (availability.invalidate(), availability.medicine_names()), 1)
+    print(f"deltas n={n_pharmacies}: {t_delta * 1e6:.0f} µs/mise à jour, reconstruction complète de l'index {t_rebuild * 1e3:.0f} ms")
+    return {"apply_delta": t_delta}
+
+
+# 14. Réservations de stock concurrentes (aucune survente)
+def bench_stock(n_ops=100_000, n_keys=200, initial=50):
+    # Stock volontairement insuffisant et changements de thread très fréquents : une survente
+    # (stock négatif, ou disponible + réservé + vendu différent du stock initial) serait détectée
+    results = {}
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    keys = [(f"Pharmacie {i % 20}", f"Médicament {i}") for i in range(n_keys)]
+    for stripes in (1, StockLedger.STRIPES):
+        for n_threads in (1, 2, 4, 8, 16):
+            ledger = StockLedger(stripes=stripes)
+            for pharm_name, med_name in keys:
+                ledger.set_stock(pharm_name, med_name, initial)
+            sold = {}
+            sold_lock = threading.Lock()
+            per_thread = n_ops // n_threads
+
+            def terminal(seed):
+                rng = random.Random(seed)
+                holder = object()
+                reserved = []
+                for _ in range(per_thread):
+                    key = rng.choice(keys)
+                    if rng.random() < 0.3 and reserved:
+                        ledger.release(holder, *reserved.pop())
+                    elif ledger.reserve(holder, *key):
+                        reserved.append(key)
+                    if len(reserved) > 20:  # Commande passée
+                        with sold_lock:
+                            for key, quantity in ledger.commit(holder).items():
+                                sold[key] = sold.get(key, 0) + quantity
+                        reserved = []
+
+            workers = [threading.Thread(target=terminal, args=(seed,)) for seed in range(n_threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            for key in keys:
+                available, reserved = ledger.get_available(*key), ledger.get_reserved(*key)
+                if available < 0 or available + reserved + sold.get(key, 0) != initial:
+                    raise AssertionError(f"stock incohérent pour {key} : {available} + {reserved} + {sold.get(key, 0)}")
+            print(f"stock {stripes:>2} verrou{'s' if stripes > 1 else ' '} {n_threads:>2} threads: "
+                  f"{per_thread * n_threads / elapsed:,.0f} opérations/s, {sum(sold.values())} vendus, aucune survente")
+            if stripes > 1:
+                results[f"stock_op_{n_threads}_threads"] = elapsed / (per_thread * n_threads)
+    sys.setswitchinterval(switch_interval)
+    return results
+
+
+# 15. Statistiques sur l'historique des commandes (colonnes NumPy)
+def bench_stats(n_lines=10_000_000, n_pharmacies=20_000, n_medicines=30_000):
+    import numpy as np
+    rng = np.random.default_rng(15)
+    store = OrderLineStore()
+    # Codes des noms attribués directement (le contenu des noms n'intervient pas dans les calculs)
+    store._pharmacies = [f"Pharmacie {i}" for i in range(n_pharmacies)]
+    store._medicines = [f"Médicament {i}" for i in range(n_medicines)]
+    sizes = rng.integers(1, 5, n_lines // 2)
+    order = np.repeat(np.arange(len(sizes)), sizes)[:n_lines]
+    start = time.perf_counter()
+    store.extend(order, rng.integers(0, 7, len(order), dtype=np.int8),
+                 rng.integers(0, n_pharmacies, len(order), dtype=np.int32),
+                 (rng.zipf(1.3, len(order)) % n_medicines).astype(np.int32),
+                 rng.integers(1, 4, len(order), dtype=np.int32), rng.integers(100, 5000, len(order), dtype=np.int32))
+    print(f"stats {len(store):,} lignes ({store.get_nb_orders():,} commandes) : chargement {time.perf_counter() - start:.2f} s")
+    t_revenue = _timeit(store.revenue_by_pharmacy_day, 3)
+    t_top = _timeit(lambda: store.top_medicines(10, "revenue"), 3)
+    t_sizes = _timeit(store.basket_sizes, 3)
+    print(f"stats: CA par pharmacie et jour {t_revenue * 1e3:.0f} ms, top médicaments {t_top * 1e3:.0f} ms, "
+          f"taille des paniers {t_sizes * 1e3:.0f} ms")
+    with tempfile.TemporaryDirectory() as directory:
+        store.save(directory)
+        start = time.perf_counter()
+        loaded = OrderLineStore.load(directory)
+        t_load = time.perf_counter() - start
+        t_mmap = _timeit(loaded.revenue_by_pharmacy_day, 1)
+        print(f"stats: relecture (mmap) {t_load * 1e3:.1f} ms, première requête {t_mmap * 1e3:.0f} ms")
+        del loaded
+    return {"revenue_by_pharmacy_day": t_revenue, "top_medicines": t_top, "basket_sizes": t_sizes}
+
+
+# 16. Service multi-sessions : charge de nombreux postes simultanés
+async def _counter_session(port, rng, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+
+    async def call(op, **params):
+        start = time.perf_counter()
+        writer.write(json.dumps(dict(params, op=op)).encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        return response
+
+    partners = (await call("delivery", name="Martin", first_name="Alice",
+                           date=f"{rng.randint(1, 28):02d}/03/2025"))['partners']
+    pharmacy_id = rng.choice(partners)[0]
+    medicines = (await call("catalog", pharmacy=pharmacy_id, limit=20))['medicines']
+    for _ in range(3):
+        await call("add", pharmacy=pharmacy_id, medicine=rng.choice(medicines)[1])
+    await call("cart")
+    response = await call("order")
+    writer.close()
+    return response['ok']
+
+async def _load_test(port, n_sessions):
+    rng = random.Random(11)
+    latencies = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_counter_session(port, random.Random(rng.random()), latencies)
+                                     for _ in range(n_sessions)))
+    return time.perf_counter() - start, sum(results), sorted(latencies)
+
+def bench_server(n_sessions=2_000, port=8766):
+    with tempfile.TemporaryDirectory() as directory:
+        server = subprocess.Popen([sys.executable, "script.py", "--serve", "--port", str(port),
+                                   "--journal", os.path.join(directory, "commandes.journal")],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            for _ in range(100):  # Attend que le serveur accepte les connexions
+                try:
+                    socket.create_connection(("127.0.0.1", port)).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            elapsed, ok, latencies = asyncio.run(_load_test(port, n_sessions))
+        finally:
+            server.terminate()
+            server.wait()
+    p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    print(f"server {n_sessions} sessions simultanées: {len(latencies) / elapsed:,.0f} requêtes/s, "
+          f"{ok} commandes passées, latence p50 {p50 * 1e3:.1f} ms, p99 {p99 * 1e3:.1f} ms")
+    return {"server_request": elapsed / len(latencies), "server_latency_p99": p99}
+
+
+BENCHMARKS = {
+    "partners": bench_partners,
+    "orders": bench_orders,
+    "dates": bench_dates,
+    "memory": bench_memory,
+    "offers": bench_offers,
+    "export": bench_export,
+    "journal": bench_journal,
+    "cart": bench_cart,
+    "tickets": bench_tickets,
+    "gui": bench_gui,
+    "geo": bench_geo,
+    "planner": bench_planner,
+    "deltas": bench_deltas,
+    "stock": bench_stock,
+    "stats": bench_stats,
+    "server": bench_server,
+}
+OPT_IN = {"gui"}  # Lancés seulement s'ils sont demandés explicitement
+
+
+def _check_history(results):
+    """
+    Compare les mesures au lancement précédent, puis les ajoute à l'historique.
+    """
+    history = []
+    if os.path.exists(HISTORY_PATH):
+        with open(HISTORY_PATH, encoding="utf-8") as history_file:
+            history = json.load(history_file)
+    previous = {}
+    for run in history:
+        previous.update(run['results'])
+    for key, value in results.items():
+        if previous.get(key) and value > previous[key] * (1 + REGRESSION_THRESHOLD):
+            print(f"RÉGRESSION {key}: {previous[key]:.3g} -> {value:.3g} (+{value / previous[key] - 1:.0%})")
+    history.append({'date': datetime.now().isoformat(timespec="seconds"), 'results': results})
+    with open(HISTORY_PATH, "w", encoding="utf-8") as history_file:
+        json.dump(history, history_file, indent=1)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    track = "--no-history" not in args
+    names = [arg for arg in args if arg != "--no-history"] or [name for name in BENCHMARKS if name not in OPT_IN]
+    results = {}
+    for name in names:
+        for key, value in (BENCHMARKS[name]() or {}).items():
+            results[f"{name}.{key}"] = value
+    if track:
+        _check_history(results)
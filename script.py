@@ -1,7 +1,27 @@
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import queue
+import random
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
-from datetime import datetime
+from itertools import accumulate, islice
+from datetime import date, datetime, timedelta
+from functools import lru_cache, partial
 import tkinter as tk
-from tkinter import messagebox, ttk, font
+from tkinter import ttk, font
 
 # 1. Énumération Day
 class Day(Enum):
@@ -14,7 +34,26 @@ class Day(Enum):
     Sunday    = 6
 
 # 2.Classe DeliveryInfo
+@lru_cache(maxsize=4096)
+def _parse_day(date_str):
+    """
+    Analyse rapide d'une date 'dd/mm/yyyy' (mise en cache par chaîne de date).
+    Les formats non standards (ex: '1/3/2025') passent par strptime.
+    """
+    try:
+        if (len(date_str) == 10 and date_str[2] == "/" and date_str[5] == "/"
+                and date_str[:2].isdigit() and date_str[3:5].isdigit() and date_str[6:].isdigit()):
+            date_obj = date(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
+        else:
+            date_obj = datetime.strptime(date_str, "%d/%m/%Y")
+    except ValueError:
+        return None
+    # weekday() retourne 0 pour Monday, 6 pour Sunday
+    return Day(date_obj.weekday())
+
 class DeliveryInfo:
+    __slots__ = ("_name", "_first_name", "_date", "_day")
+
     def __init__(self, name="", first_name="", date_str=""):
         self._name = name
         self._first_name = first_name
@@ -26,142 +65,3021 @@ class DeliveryInfo:
         """
         Transforme une date au format 'dd/mm/yyyy' en un élément de Day.
         """
+        return _parse_day(date_str)
+
+    @staticmethod
+    def compute_days(date_strs):
+        """
+        Version en lot de compute_day : chaque date distincte n'est analysée qu'une fois.
+        """
+        days = {date_str: _parse_day(date_str) for date_str in set(date_strs)}
+        return [days[date_str] for date_str in date_strs]
+
+    def get_name(self):
+        return self._name
+    def set_name(self, name):
+        self._name = name
+
+    def get_first_name(self):
+        return self._first_name
+    def set_first_name(self, first_name):
+        self._first_name = first_name
+
+    def get_date(self):
+        return self._date
+    def set_date(self, date_str):
+        self._date = date_str
+        self._day = self.compute_day(date_str)
+
+    def get_day(self):
+        return self._day
+
+    def __str__(self):
+        day_str = self._day.name if self._day else "Inconnu"
+        return f"{self._first_name} {self._name} - Date: {self._date} ({day_str})"
+
+# 3. Classe Medicine
+class Medicine:
+    __slots__ = ("_name", "_description", "_price")
+
+    def __init__(self, name, description, price):
+        self._name = name
+        self._description = description
+        self._price = price
+
+    def get_name(self):
+        return self._name
+    def get_description(self):
+        return self._description
+    def get_price(self):
+        return self._price
+
+    def __str__(self):
+        return f"{self._name} : {self._description} - {self._price} €"
+
+class MedicineTable:
+    """
+    Table partagée des médicaments : chaque médicament (nom, description, prix) n'y est
+    stocké qu'une fois et les catalogues des pharmacies ne gardent que son identifiant.
+    Chaque intern compte une référence, rendue par release : un médicament qui n'est plus
+    référencé (ancien prix remplacé, retrait du catalogue) est retiré de la table. Les
+    identifiants ne sont jamais réattribués, un identifiant périmé ne désigne donc pas un autre médicament.
+    """
+    def __init__(self):
+        self._medicines = {}  # Identifiant -> Medicine
+        self._ids = {}  # (nom, description, prix) -> identifiant
+        self._refs = {}  # Identifiant -> nombre de références
+        self._next_id = 0
+
+    @staticmethod
+    def key(med):
+        return (med.get_name(), med.get_description(), med.get_price())
+
+    def intern(self, med):
+        key = self.key(med)
+        medicine_id = self._ids.get(key)
+        if medicine_id is None:
+            medicine_id = self._ids[key] = self._next_id
+            self._next_id += 1
+            self._medicines[medicine_id] = med
+            self._refs[medicine_id] = 1
+        else:
+            self._refs[medicine_id] += 1
+        return medicine_id
+
+    def release(self, medicine_id):
+        """Rend une référence obtenue par intern ; le médicament est retiré à la dernière."""
+        refs = self._refs[medicine_id] - 1
+        if refs:
+            self._refs[medicine_id] = refs
+        else:
+            del self._refs[medicine_id]
+            del self._ids[self.key(self._medicines.pop(medicine_id))]
+
+    def get(self, medicine_id):
+        return self._medicines[medicine_id]
+
+    def __len__(self):
+        return len(self._medicines)
+
+MEDICINES = MedicineTable()
+
+# 4.Classe Pharmacy
+def days_to_mask(days):
+    """Encode une liste de Day en masque de 7 bits (bit 0 = Monday)."""
+    mask = 0
+    for day in days:
+        mask |= 1 << day.value
+    return mask
+
+# Tuple des jours pour chacun des 128 masques possibles (partagés entre pharmacies)
+_DAYS_BY_MASK = [tuple(day for day in Day if mask & (1 << day.value)) for mask in range(128)]
+
+def mask_to_days(mask):
+    return _DAYS_BY_MASK[mask]
+
+class CatalogView(Sequence):
+    """
+    Vue du catalogue d'une pharmacie : un tableau d'identifiants dans MEDICINES.
+    """
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [MEDICINES.get(medicine_id) for medicine_id in self._ids[index]]
+        return MEDICINES.get(self._ids[index])
+
+    def append(self, med):
+        self._ids.append(MEDICINES.intern(med))
+
+class Pharmacy:
+    __slots__ = ("_name", "_description", "_open_days_mask", "_catalog", "_partner_sets", "_location", "_version")
+
+    def __init__(self, name, description, open_days=None, catalog=None):
+        self._name = name
+        self._description = description
+        # Jours d'ouverture sous forme de masque de 7 bits
+        self._open_days_mask = days_to_mask(open_days) if open_days else 0
+        # Catalogue sous forme de tableau d'identifiants dans la table partagée MEDICINES
+        self._catalog = array("i", [MEDICINES.intern(med) for med in catalog] if catalog else [])
+        # PartnersSet qui indexent cette pharmacie par jour d'ouverture
+        self._partner_sets = ()
+        # Position (latitude, longitude), connue si l'adresse a été géocodée
+        self._location = None
+        # Version du catalogue (dernière mise à jour du fournisseur appliquée, voir CatalogUpdater)
+        self._version = 0
+
+    def get_name(self):
+        return self._name
+    def get_description(self):
+        return self._description
+    def get_address(self):
+        # La description commence par l'adresse : "13 Pl. Bellevue, Pharmacie centrale"
+        return self._description.partition(",")[0].strip()
+    def get_location(self):
+        return self._location
+    def set_location(self, location):
+        self._location = location
+    def get_open_days(self):
+        return mask_to_days(self._open_days_mask)
+    def get_open_days_mask(self):
+        return self._open_days_mask
+    def is_open_on(self, day):
+        return bool(self._open_days_mask & (1 << day.value))
+    def set_open_days(self, open_days):
+        self._open_days_mask = days_to_mask(open_days)
+        # Les index par jour des PartnersSet sont tenus à jour
+        for partner_set in self._partner_sets:
+            partner_set._reindex_partner(self)
+    def get_version(self):
+        return self._version
+    def set_version(self, version):
+        self._version = version
+    def get_catalog(self):
+        return CatalogView(self._catalog)
+    def add_medicine(self, med):
+        self._catalog.append(MEDICINES.intern(med))
+
+    def _find_position(self, med_name):
+        for position, med in enumerate(self.get_catalog()):
+            if med.get_name() == med_name:
+                return position
+        return None
+
+    def set_price(self, med_name, price):
+        """
+        Change le prix d'un médicament du catalogue et retourne le nouveau Medicine (None s'il est absent).
+        Les Medicine sont partagés entre pharmacies : l'entrée du catalogue est remplacée, pas modifiée.
+        """
+        position = self._find_position(med_name)
+        if position is None:
+            return None
+        old_id = self._catalog[position]
+        med = MEDICINES.get(old_id)
+        med = Medicine(med.get_name(), med.get_description(), price)
+        self._catalog[position] = MEDICINES.intern(med)
+        MEDICINES.release(old_id)
+        return med
+
+    def replace_medicine(self, med):
+        """Remplace (à la même position) le médicament de même nom. Retourne False s'il n'y était pas."""
+        position = self._find_position(med.get_name())
+        if position is None:
+            return False
+        old_id = self._catalog[position]
+        self._catalog[position] = MEDICINES.intern(med)
+        MEDICINES.release(old_id)
+        return True
+
+    def remove_medicine(self, med_name):
+        """Retire un médicament du catalogue. Retourne False s'il n'y était pas."""
+        position = self._find_position(med_name)
+        if position is None:
+            return False
+        MEDICINES.release(self._catalog.pop(position))
+        return True
+
+    def __str__(self):
+        days = ', '.join(day.name for day in self.get_open_days())
+        return f"Pharmacie {self._name} (Ouverte: {days})"
+
+# 5. Classe PartnersSet
+class PartnersSet:
+    def __init__(self, existing_partners=None):
+        self._existing_partners = []  # Liste de Pharmacy
+        # Index par jour : pour chaque Day, dictionnaire pharmacie -> rang d'ajout
+        self._partners_by_day = {day: {} for day in Day}
+        # Vues immuables (tuples) par jour, reconstruites seulement après modification
+        self._views_by_day = {}
+        self._available_partners = ()
+        self._available_day = None
+        self._active_partner = None
+        self._partners_by_name = {}  # Nom -> Pharmacy (tenu à jour par add_partner)
+        self.add_partners(existing_partners if existing_partners else [])
+
+    def get_existing_partners(self):
+        return self._existing_partners
+    def get_available_partners(self):
+        return self._available_partners
+    def get_active_partner(self):
+        return self._active_partner
+    def set_active_partner(self, partner):
+        self._active_partner = partner
+    def find_partner(self, name):
+        """Retourne la pharmacie partenaire de ce nom (None si elle est inconnue)."""
+        return self._partners_by_name.get(name)
+
+    def add_partner(self, pharmacy):
+        """
+        Ajoute une pharmacie partenaire et l'enregistre dans l'index par jour.
+        """
+        self._existing_partners.append(pharmacy)
+        self._partners_by_name[pharmacy.get_name()] = pharmacy
+        pharmacy._partner_sets += (self,)
+        self._index_partner(pharmacy, pharmacy.get_open_days())
+
+    def add_partners(self, pharmacies):
+        for pharmacy in pharmacies:
+            self.add_partner(pharmacy)
+
+    def _index_partner(self, pharmacy, days, rank=None):
+        if rank is None:
+            rank = len(self._existing_partners) - 1
+        for day in set(days):
+            self._partners_by_day[day][pharmacy] = rank
+            self._views_by_day.pop(day, None)
+
+    def _reindex_partner(self, pharmacy):
+        """
+        Appelée par Pharmacy.set_open_days : déplace la pharmacie dans l'index
+        en conservant son rang d'ajout (et donc l'ordre d'affichage).
+        """
+        rank = None
+        for day in Day:
+            if pharmacy in self._partners_by_day[day]:
+                rank = self._partners_by_day[day].pop(pharmacy)
+                self._views_by_day.pop(day, None)
+        if rank is None:
+            rank = self._existing_partners.index(pharmacy)
+        self._index_partner(pharmacy, pharmacy.get_open_days(), rank)
+        if self._available_day is not None:
+            self._available_partners = self.get_partners_by_day(self._available_day)
+
+    def get_partners_by_day(self, day):
+        """
+        Retourne le tuple (partagé, non modifiable) des partenaires ouverts le jour passé,
+        dans l'ordre d'ajout.
+        """
+        view = self._views_by_day.get(day)
+        if view is None:
+            partners = self._partners_by_day[day]
+            view = tuple(sorted(partners, key=partners.__getitem__))
+            self._views_by_day[day] = view
+        return view
+
+    def is_open(self, pharmacy, day):
+        return pharmacy in self._partners_by_day[day]
+
+    def update_available_by_day(self, day):
+        """
+        Met à jour la liste des partenaires disponibles en fonction du jour passé.
+        """
+        self._available_day = day
+        self._available_partners = self.get_partners_by_day(day)
+
+    def __str__(self):
+        partners = ', '.join(p.get_name() for p in self._available_partners)
+        return f"Partenaires disponibles: {partners}"
+
+# 6. Classe Cart
+def price_to_cents(price):
+    """Convertit un prix en euros (float) en nombre entier de centimes."""
+    return round(price * 100)
+
+def check_quantity(quantity, minimum=0):
+    """Lève ValueError si quantity n'est pas un entier supérieur ou égal à minimum."""
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < minimum:
+        raise ValueError(f"Quantité invalide : {quantity!r}")
+    return quantity
+
+class Cart:
+    def __init__(self, stock=None):
+        # Nom de pharmacie -> {nom du médicament: {'med': Medicine, 'quantity': int}}
+        self._lines = {}
+        # StockLedger facultatif : chaque exemplaire ajouté y est réservé (le panier est le détenteur)
+        self._stock = stock
+        self._nb_med = 0
+        self._total_cents = 0  # Total tenu en centimes entiers pour éviter la dérive des floats
+
+    def add_to_cart(self, med, pharm_name="Inconnu", quantity=1):
+        check_quantity(quantity)
+        self.set_quantity(med, self.get_quantity(med, pharm_name) + quantity, pharm_name)
+
+    def remove_from_cart(self, med, pharm_name="Inconnu", quantity=1):
+        check_quantity(quantity)
+        current = self.get_quantity(med, pharm_name)
+        if current > 0:
+            self.set_quantity(med, max(0, current - quantity), pharm_name)
+
+    def set_quantity(self, med, quantity, pharm_name="Inconnu"):
+        """
+        Fixe directement la quantité d'un médicament (0 le retire du panier).
+        Avec un StockLedger, la différence est réservée ou libérée ; lève ValueError
+        (sans rien modifier) si la quantité n'est pas un entier positif ou si le stock est insuffisant.
+        """
+        check_quantity(quantity)
+        meds = self._lines.get(pharm_name, {})
+        line = meds.get(med.get_name())
+        delta = quantity - (line['quantity'] if line else 0)
+        if self._stock is not None and delta > 0:
+            if not self._stock.reserve(self, pharm_name, med.get_name(), delta):
+                raise ValueError(f"Stock insuffisant chez {pharm_name} : {med.get_name()}")
+        elif self._stock is not None and delta < 0:
+            self._stock.release(self, pharm_name, med.get_name(), -delta)
+        meds = self._lines.setdefault(pharm_name, meds)
+        if line is None:
+            line = meds[med.get_name()] = {'med': med, 'quantity': 0}
+        line['quantity'] = quantity
+        self._nb_med += delta
+        # Prix de la ligne : après un reprice, med peut être l'ancien Medicine (répartition calculée avant)
+        self._total_cents += delta * price_to_cents(line['med'].get_price())
+        if quantity == 0:
+            del meds[med.get_name()]
+        if not meds:
+            del self._lines[pharm_name]
+
+    def clear(self):
+        """Vide le panier (et libère les réservations encore en cours)."""
+        if self._stock is not None:
+            self._stock.release_all(self)
+        self._lines = {}
+        self._nb_med = 0
+        self._total_cents = 0
+
+    def reprice(self, med, pharm_name="Inconnu"):
+        """
+        Remplace le Medicine d'une ligne (après un changement de prix) et corrige le total.
+        Retourne False si la ligne n'est pas dans le panier.
+        """
+        line = self._lines.get(pharm_name, {}).get(med.get_name())
+        if line is None:
+            return False
+        self._total_cents += line['quantity'] * (price_to_cents(med.get_price()) - price_to_cents(line['med'].get_price()))
+        line['med'] = med
+        return True
+
+    def get_quantity(self, med, pharm_name="Inconnu"):
+        line = self._lines.get(pharm_name, {}).get(med.get_name())
+        return line['quantity'] if line else 0
+
+    def get_line(self, pharm_name, med_name):
+        return self._lines.get(pharm_name, {}).get(med_name)
+    def get_lines(self):
+        return self._lines
+
+    def get_nb_med(self):
+        return self._nb_med
+    def get_total_cents(self):
+        return self._total_cents
+    def get_total_price(self):
+        return self._total_cents / 100
+    def get_order(self):
+        return [line['med'] for meds in self._lines.values() for line in meds.values()
+                for _ in range(line['quantity'])]
+
+    def __str__(self):
+        meds = ', '.join(med.get_name() for med in self.get_order())
+        return f"{self._nb_med} médicaments ({meds}) - Total: {self.get_total_price():.2f} €"
+
+# 7. Classe CartView (affichage détaillé du panier)
+class CartView:
+    """
+    Affiche le détail du panier avec une ligne par couple (pharmacie, médicament).
+    Les lignes sont conservées d'un clic à l'autre : seule la ligne concernée est
+    modifiée, ajoutée ou supprimée. Les compteurs widgets_created et widgets_destroyed
+    permettent de vérifier le coût de chaque opération (last_operation).
+    """
+    def __init__(self, parent, on_remove):
+        self._parent = parent
+        self._on_remove = on_remove
+        self._groups = {}  # Nom de pharmacie -> {'frame', 'separator', 'lines': {nom du médicament: ligne}}
+        self.widgets_created = 0
+        self.widgets_destroyed = 0
+        self.last_operation = (0, 0)  # (widgets créés, widgets détruits) lors de la dernière opération
+
+    def get_keys(self):
+        return [(pharm, med_name) for pharm, group in self._groups.items() for med_name in group['lines']]
+
+    def _new_widget(self, widget_class, *args, **kwargs):
+        self.widgets_created += 1
+        return widget_class(*args, **kwargs)
+
+    def _destroy_widget(self, widget):
+        stack = [widget]
+        while stack:
+            self.widgets_destroyed += 1
+            stack.extend(stack.pop().winfo_children())
+        widget.destroy()
+
+    def _add_group(self, pharm):
+        group_frame = self._new_widget(ttk.Frame, self._parent)
+        group_frame.pack(fill=tk.X)
+        # Séparateur entre pharmacies (masqué pour la première)
+        separator = self._new_widget(ttk.Separator, group_frame, orient='horizontal')
+        if self._groups:
+            separator.pack(fill=tk.X, pady=5)
+        pharm_label = self._new_widget(ttk.Label, group_frame, text=pharm, font=("Helvetica", 8, "italic"), foreground="#555555")
+        pharm_label.pack(anchor="w", pady=(5, 0))
+        group = {'frame': group_frame, 'separator': separator, 'lines': {}}
+        self._groups[pharm] = group
+        return group
+
+    def _add_line(self, group, pharm, med_name):
+        line_frame = self._new_widget(ttk.Frame, group['frame'])
+        line_frame.pack(fill="x", padx=10, pady=2)
+        med_label = self._new_widget(ttk.Label, line_frame, font=("Helvetica", 10))
+        med_label.pack(side=tk.LEFT, anchor="w")
+        # Bouton de retrait d'un exemplaire
+        remove_button = self._new_widget(ttk.Button, line_frame, text="❌", width=3,
+                                         command=lambda p=pharm, m=med_name: self._on_remove(p, m))
+        remove_button.pack(side=tk.RIGHT)
+        line = {'frame': line_frame, 'label': med_label}
+        group['lines'][med_name] = line
+        return line
+
+    def _start_operation(self):
+        return self.widgets_created, self.widgets_destroyed
+
+    def _end_operation(self, start):
+        self.last_operation = (self.widgets_created - start[0], self.widgets_destroyed - start[1])
+
+    def set_line(self, pharm, med_name, quantity, unit_price):
+        """
+        Met à jour (ou crée) la ligne d'un médicament avec sa quantité et son prix.
+        """
+        start = self._start_operation()
+        group = self._groups.get(pharm) or self._add_group(pharm)
+        line = group['lines'].get(med_name) or self._add_line(group, pharm, med_name)
+        total_price = quantity * unit_price
+        line['label'].config(text=f"• {med_name} x{quantity} - {unit_price:.2f} € chacun, total {total_price:.2f} €")
+        self._end_operation(start)
+
+    def remove_line(self, pharm, med_name):
+        """
+        Supprime la ligne d'un médicament, et le groupe de la pharmacie s'il devient vide.
+        """
+        start = self._start_operation()
+        group = self._groups.get(pharm)
+        if group is not None and med_name in group['lines']:
+            self._destroy_widget(group['lines'].pop(med_name)['frame'])
+            if not group['lines']:
+                was_first = next(iter(self._groups)) == pharm
+                self._destroy_widget(group['frame'])
+                del self._groups[pharm]
+                if was_first and self._groups:
+                    next(iter(self._groups.values()))['separator'].pack_forget()
+        self._end_operation(start)
+
+# 8. Classe OrderService (logique de commande, sans interface graphique)
+class OrderService:
+    """
+    Regroupe la logique de commande (informations de livraison, choix de la pharmacie,
+    panier et ticket) sans dépendre de Tkinter. MyPharmApp l'utilise pour ses callbacks,
+    et process_orders permet de traiter des commandes en lot sans affichage.
+
+    Une demande de commande est un dictionnaire :
+        {'name': ..., 'first_name': ..., 'date': 'dd/mm/yyyy',
+         'items': [(nom de la pharmacie, nom du médicament, quantité), ...]}
+    """
+    def __init__(self, partner_set):
+        self._partner_set = partner_set
+        self._catalogs_by_pharmacy = {}  # Pharmacy -> {nom du médicament: Medicine}
+
+    def get_partner_set(self):
+        return self._partner_set
+
+    def save_delivery_info(self, deliv_info, name, first_name, date_str):
+        """
+        Enregistre les informations de livraison et met à jour les partenaires disponibles.
+        Retourne le jour de livraison (None si la date est invalide).
+        """
+        if not name or not first_name:
+            raise ValueError("Veuillez remplir tous les champs.")
+        deliv_info.set_date(date_str)
+        deliv_info.set_name(name)
+        deliv_info.set_first_name(first_name)
+        day = deliv_info.get_day()
+        if day:
+            self._partner_set.update_available_by_day(day)
+        return day
+
+    def select_partner(self, index):
+        """
+        Sélectionne la pharmacie d'indice index parmi les partenaires disponibles.
+        """
+        available_partners = self._partner_set.get_available_partners()
+        if 0 <= index < len(available_partners):
+            self._partner_set.set_active_partner(available_partners[index])
+            return available_partners[index]
+        return None
+
+    def add_to_cart(self, cart, med, quantity=1):
+        """
+        Ajoute un médicament de la pharmacie active au panier et retourne le nom de la pharmacie.
+        """
+        active_pharmacy = self._partner_set.get_active_partner()
+        pharm_name = active_pharmacy.get_name() if active_pharmacy else "Inconnu"
+        cart.add_to_cart(med, pharm_name, quantity)
+        return pharm_name
+
+    def remove_from_cart(self, cart, pharm_name, med_name):
+        info = cart.get_line(pharm_name, med_name)
+        if info is None:
+            return False
+        cart.remove_from_cart(info['med'], pharm_name)
+        return True
+
+    def iter_ticket_lines(self, deliv_info, cart):
+        """
+        Produit, une à une, les lignes du ticket de commande récapitulatif.
+        """
+        day = deliv_info.get_day()
+        yield "=== Ticket de commande ==="
+        yield ""
+        yield "Informations patient:"
+        yield f"Nom: {deliv_info.get_name()}"
+        yield f"Prénom: {deliv_info.get_first_name()}"
+        yield f"Date: {deliv_info.get_date()} ({day.name if day else 'Inconnu'})"
+        yield ""
+        yield "Détails du panier:"
+        for pharm, meds in cart.get_lines().items():
+            yield f"Pharmacie: {pharm}"
+            for med_name, info in meds.items():
+                quantity = info['quantity']
+                unit_price = info['med'].get_price()
+                total_price = quantity * price_to_cents(unit_price) / 100
+                yield f"  • {med_name} x{quantity} - {unit_price:.2f} € chacun, total {total_price:.2f} €"
+            yield ""
+        yield f"Total de la commande: {cart.get_total_price():.2f} €"
+
+    def build_ticket_lines(self, deliv_info, cart):
+        return list(self.iter_ticket_lines(deliv_info, cart))
+
+    def render_ticket(self, deliv_info, cart, fmt="txt", order_no=0):
+        """
+        Rend un ticket au format 'txt' (ticket texte), 'csv' (une ligne par médicament)
+        ou 'json' (un objet JSON par ligne).
+        """
+        if fmt == "txt":
+            return "\n".join(self.iter_ticket_lines(deliv_info, cart)) + "\n\n"
+        day = deliv_info.get_day()
+        day_name = day.name if day else ""
+        rows = [(pharm, med_name, info['quantity'], price_to_cents(info['med'].get_price()))
+                for pharm, meds in cart.get_lines().items() for med_name, info in meds.items()]
+        if fmt == "json":
+            return json.dumps({
+                'order': order_no, 'name': deliv_info.get_name(), 'first_name': deliv_info.get_first_name(),
+                'date': deliv_info.get_date(), 'day': day_name, 'total_cents': cart.get_total_cents(),
+                'lines': [{'pharmacy': pharm, 'medicine': med_name, 'quantity': quantity, 'unit_price_cents': cents}
+                          for pharm, med_name, quantity, cents in rows],
+            }, ensure_ascii=False) + "\n"
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for pharm, med_name, quantity, cents in rows:
+                writer.writerow((order_no, deliv_info.get_name(), deliv_info.get_first_name(), deliv_info.get_date(),
+                                 day_name, pharm, med_name, quantity, f"{cents / 100:.2f}", f"{quantity * cents / 100:.2f}"))
+            return buffer.getvalue()
+        raise ValueError(f"Format de ticket inconnu : {fmt}")
+
+    def update_pharmacy(self, pharmacy, changed_names, open_days_changed):
+        # Le catalogue par nom de cette pharmacie sera reconstruit à la prochaine commande
+        self._catalogs_by_pharmacy.pop(pharmacy, None)
+
+    def _find_medicine(self, pharmacy, med_name):
+        catalog = self._catalogs_by_pharmacy.get(pharmacy)
+        if catalog is None or len(catalog) != len(pharmacy.get_catalog()):
+            catalog = {med.get_name(): med for med in pharmacy.get_catalog()}
+            self._catalogs_by_pharmacy[pharmacy] = catalog
+        return catalog.get(med_name)
+
+    def order_record(self, deliv_info, cart):
+        """
+        Décrit une commande passée sous une forme sérialisable (même format qu'une demande
+        de commande, avec le total et l'heure), pour le journal des commandes.
+        """
+        return {
+            'placed_at': datetime.now().isoformat(timespec="seconds"),
+            'name': deliv_info.get_name(),
+            'first_name': deliv_info.get_first_name(),
+            'date': deliv_info.get_date(),
+            'items': [[pharm, med_name, info['quantity']] for pharm, meds in cart.get_lines().items()
+                      for med_name, info in meds.items()],
+            'unit_prices_cents': [price_to_cents(info['med'].get_price()) for meds in cart.get_lines().values()
+                                  for info in meds.values()],
+            'total_cents': cart.get_total_cents(),
+        }
+
+    def process_order(self, request):
+        """
+        Traite une demande de commande complète (voir la docstring de la classe).
+        Retourne un dictionnaire {'ok', 'error', 'ticket', 'total_cents'}.
+        """
         try:
-            date_obj = datetime.strptime(date_str, "%d/%m/%Y")
-            # weekday() retourne 0 pour Monday, 6 pour Sunday
-            weekday = date_obj.weekday()
-            for day in Day:
-                if day.value == weekday:
-                    return day
-        except ValueError:
+            deliv_info, cart = self.build_order(request)
+        except ValueError as error:
+            return {'ok': False, 'error': str(error), 'ticket': None, 'total_cents': 0}
+        ticket = "\n".join(self.iter_ticket_lines(deliv_info, cart))
+        return {'ok': True, 'error': None, 'ticket': ticket, 'total_cents': cart.get_total_cents()}
+
+    def build_order(self, request):
+        """
+        Valide une demande de commande et retourne (DeliveryInfo, Cart).
+        Lève ValueError si la demande n'est pas valide.
+        """
+        deliv_info = DeliveryInfo(request.get('name', ""), request.get('first_name', ""), request.get('date', ""))
+        day = deliv_info.get_day()
+        if not deliv_info.get_name() or not deliv_info.get_first_name():
+            raise ValueError("Veuillez remplir tous les champs.")
+        if day is None:
+            raise ValueError("Date invalide, impossible de déterminer le jour.")
+        cart = Cart()
+        for pharm_name, med_name, quantity in request.get('items', ()):
+            check_quantity(quantity, minimum=1)
+            pharmacy = self._partner_set.find_partner(pharm_name)
+            if pharmacy is None or not self._partner_set.is_open(pharmacy, day):
+                raise ValueError(f"Pharmacie indisponible le {day.name} : {pharm_name}")
+            med = self._find_medicine(pharmacy, med_name)
+            if med is None:
+                raise ValueError(f"Médicament introuvable chez {pharm_name} : {med_name}")
+            cart.add_to_cart(med, pharm_name, quantity)
+        return deliv_info, cart
+
+    def process_orders(self, requests):
+        """
+        Traite un itérable de demandes de commande et produit les résultats au fil de l'eau.
+        """
+        for request in requests:
+            yield self.process_order(request)
+
+# 9. Catalogue persistant (SQLite)
+class LazyCatalog(Sequence):
+    """
+    Catalogue d'une pharmacie chargée depuis un CatalogStore : il contient les identifiants
+    des médicaments, et un Medicine n'est créé que lorsqu'on accède à l'élément
+    (affichage d'une ligne, ajout au panier...).
+    """
+    def __init__(self, store, medicine_ids):
+        self._store = store
+        self._items = list(medicine_ids)  # Identifiant (int) ou Medicine déjà créé
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if isinstance(item, int):
+            item = self._items[index] = self._store.get_medicine(item)
+        return item
+
+    def append(self, med):
+        self._items.append(med)
+
+    def __setitem__(self, index, med):
+        self._items[index] = med
+
+    def __delitem__(self, index):
+        del self._items[index]
+
+class StoredPharmacy(Pharmacy):
+    """
+    Pharmacie lue depuis un CatalogStore : le catalogue n'est lu qu'au premier appel de get_catalog.
+    """
+    __slots__ = ("_store", "_id")
+
+    def __init__(self, store, pharmacy_id, name, description, open_days_mask):
+        super().__init__(name, description)
+        self._store = store
+        self._id = pharmacy_id
+        self._open_days_mask = open_days_mask
+        self._catalog = None
+
+    def get_id(self):
+        return self._id
+    def get_catalog(self):
+        if self._catalog is None:
+            self._catalog = LazyCatalog(self._store, self._store.get_catalog_ids(self._id))
+        return self._catalog
+    def add_medicine(self, med):
+        self.get_catalog().append(med)
+
+    def set_price(self, med_name, price):
+        position = self._find_position(med_name)
+        if position is None:
             return None
+        med = self.get_catalog()[position]
+        med = self.get_catalog()[position] = Medicine(med.get_name(), med.get_description(), price)
+        return med
+
+    def replace_medicine(self, med):
+        position = self._find_position(med.get_name())
+        if position is None:
+            return False
+        self.get_catalog()[position] = med
+        return True
+
+    def remove_medicine(self, med_name):
+        position = self._find_position(med_name)
+        if position is None:
+            return False
+        del self.get_catalog()[position]
+        return True
+
+class CatalogStore:
+    """
+    Catalogue national stocké dans une base SQLite. L'ouverture ne lit rien ;
+    les pharmacies sont lues en une requête, leurs catalogues à la demande,
+    et chaque Medicine n'est créé qu'une fois (il est partagé entre pharmacies).
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS medicine (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL, price_cents INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS pharmacy (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL, open_days INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS catalog (
+            pharmacy_id INTEGER NOT NULL, position INTEGER NOT NULL, medicine_id INTEGER NOT NULL,
+            PRIMARY KEY (pharmacy_id, position)) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        # La base peut être lue depuis les threads de BackgroundWorker : accès protégés par un verrou
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._medicines = {}  # Identifiant -> Medicine déjà créé
+
+    def close(self):
+        self._connection.close()
+
+    @classmethod
+    def write(cls, path, pharmacies):
+        """
+        Crée (ou remplace) une base catalogue à partir d'une liste de Pharmacy.
+        Les médicaments partagés entre pharmacies ne sont enregistrés qu'une fois.
+        """
+        store = cls(path)
+        with store._connection as connection:
+            connection.execute("DELETE FROM catalog")
+            connection.execute("DELETE FROM pharmacy")
+            connection.execute("DELETE FROM medicine")
+            medicine_ids = {}
+            for pharmacy_id, pharmacy in enumerate(pharmacies):
+                connection.execute("INSERT INTO pharmacy VALUES (?, ?, ?, ?)",
+                                   (pharmacy_id, pharmacy.get_name(), pharmacy.get_description(),
+                                    pharmacy.get_open_days_mask()))
+                rows = []
+                for position, med in enumerate(pharmacy.get_catalog()):
+                    if id(med) not in medicine_ids:
+                        medicine_ids[id(med)] = len(medicine_ids)
+                        connection.execute("INSERT INTO medicine VALUES (?, ?, ?, ?)",
+                                           (medicine_ids[id(med)], med.get_name(), med.get_description(),
+                                            price_to_cents(med.get_price())))
+                    rows.append((pharmacy_id, position, medicine_ids[id(med)]))
+                connection.executemany("INSERT INTO catalog VALUES (?, ?, ?)", rows)
+        return store
+
+    def load_pharmacies(self):
+        """
+        Lit les pharmacies (nom, description, masque des jours d'ouverture) sans leurs catalogues.
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT id, name, description, open_days FROM pharmacy ORDER BY id").fetchall()
+        return [StoredPharmacy(self, *row) for row in rows]
+
+    def get_catalog_ids(self, pharmacy_id):
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT medicine_id FROM catalog WHERE pharmacy_id = ? ORDER BY position", (pharmacy_id,))
+            return [row[0] for row in cursor]
+
+    def get_medicine(self, medicine_id):
+        med = self._medicines.get(medicine_id)
+        if med is None:
+            with self._lock:
+                med = self._medicines.get(medicine_id)
+                if med is None:
+                    name, description, price_cents = self._connection.execute(
+                        "SELECT name, description, price_cents FROM medicine WHERE id = ?", (medicine_id,)).fetchone()
+                    med = self._medicines[medicine_id] = Medicine(name, description, price_cents / 100)
+        return med
+
+# Export des tickets en lot (pool de processus)
+_export_service = None  # OrderService propre à chaque processus d'export
+
+def _export_init(catalog_path):
+    global _export_service
+    pharmacies = CatalogStore(catalog_path).load_pharmacies() if catalog_path else fake_pharmacies()
+    _export_service = OrderService(PartnersSet(pharmacies))
+
+def _export_chunk(args):
+    first_no, requests, fmt = args
+    parts = []
+    nb_errors = 0
+    for order_no, request in enumerate(requests, first_no):
+        try:
+            deliv_info, cart = _export_service.build_order(request)
+        except ValueError:
+            nb_errors += 1
+            continue
+        parts.append(_export_service.render_ticket(deliv_info, cart, fmt, order_no))
+    return "".join(parts), len(requests) - nb_errors, nb_errors
+
+def _chunks(requests, fmt, chunk_size):
+    chunk = []
+    first_no = 0
+    for request in requests:
+        chunk.append(request)
+        if len(chunk) == chunk_size:
+            yield first_no, chunk, fmt
+            first_no += len(chunk)
+            chunk = []
+    if chunk:
+        yield first_no, chunk, fmt
+
+CSV_HEADER = ("commande", "nom", "prenom", "date", "jour", "pharmacie", "medicament", "quantite", "prix_unitaire", "total")
+
+def export_tickets(requests, path, fmt=None, catalog_path=None, workers=None, chunk_size=1000):
+    """
+    Rend les tickets d'un itérable de demandes de commande (voir OrderService) et les écrit
+    dans path, au format 'txt', 'csv' ou 'json' (JSON lines ; déduit de l'extension par défaut).
+    Le rendu est réparti par paquets de chunk_size commandes sur un pool de processus, et
+    les paquets sont écrits dans l'ordre avec un tampon d'écriture de 1 Mo. Au plus
+    deux paquets par processus sont en cours à la fois : les demandes sont lues au fil de l'eau.
+    Retourne {'tickets', 'errors', 'seconds', 'tickets_per_second'}.
+    """
+    fmt = fmt if fmt else path.rsplit(".", 1)[-1].lower()
+    if fmt not in ("txt", "csv", "json"):
+        raise ValueError(f"Format de ticket inconnu : {fmt}")
+    start = time.perf_counter()
+    nb_tickets = nb_errors = 0
+    window = 2 * (workers or os.cpu_count() or 1)
+    with open(path, "w", encoding="utf-8", newline="", buffering=1 << 20) as output, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_export_init, initargs=(catalog_path,)) as executor:
+        if fmt == "csv":
+            csv.writer(output).writerow(CSV_HEADER)
+        # executor.map soumettrait tous les paquets d'un coup : fenêtre bornée de paquets en cours
+        chunks = _chunks(requests, fmt, chunk_size)
+        pending = deque()
+        while True:
+            pending.extend(executor.submit(_export_chunk, chunk) for chunk in islice(chunks, window - len(pending)))
+            if not pending:
+                break
+            text, nb_ok, nb_ko = pending.popleft().result()
+            output.write(text)
+            nb_tickets += nb_ok
+            nb_errors += nb_ko
+    seconds = time.perf_counter() - start
+    return {'tickets': nb_tickets, 'errors': nb_errors, 'seconds': seconds,
+            'tickets_per_second': nb_tickets / seconds if seconds else 0.0}
+
+# Réseau synthétique (reproductible) pour les benchmarks et les tests de charge
+_WORDS = ["Doli", "Ibu", "Para", "Amoxi", "Rhino", "Vita", "Magné", "Homéo", "Spasfo", "Smec",
+          "Gavis", "Strep", "Hexa", "Euca", "Calci", "Fero", "Zinc", "Bio", "Derma", "Ophta"]
+_SUFFIXES = ["prane", "fène", "cilline", "sil", "flu", "mine", "rol", "con", "sol", "tab"]
+_FORMS = ["comprimés", "gélules", "sirop", "spray nasal", "crème", "sachets", "collyre", "pastilles"]
+_USES = ["contre la douleur", "contre la fièvre", "contre la toux", "pour la digestion", "contre le rhume",
+         "contre la fatigue", "pour le sommeil", "pour la peau", "contre les allergies", "pour les yeux"]
+_SCHEDULES = [  # (jours d'ouverture, probabilité)
+    ([Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday], 0.45),
+    ([Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday, Day.Saturday], 0.35),
+    (list(Day), 0.10),
+    ([Day.Saturday, Day.Sunday], 0.03),
+]
+
+def generate_network(n_pharmacies, n_medicines, seed=0, median_catalog_size=60, price_spread=0.0):
+    """
+    Génère un réseau de n_pharmacies pharmacies partageant n_medicines médicaments, toujours
+    le même pour une graine donnée :
+    - jours d'ouverture : semaine (45 %), semaine + samedi (35 %), tous les jours (10 %),
+      week-end (3 %), jours quelconques sinon ;
+    - taille des catalogues : loi log-normale autour de median_catalog_size ;
+    - popularité des médicaments : loi de Zipf (quelques médicaments sont dans presque tous les catalogues) ;
+    - prix : loi log-normale (autour de 8 €) ; avec price_spread > 0, chaque pharmacie
+      applique son propre écart de prix (±price_spread) ;
+    - position : autour d'une centaine de villes réparties en France métropolitaine.
+    """
+    rng = random.Random(seed)
+    # Tirage séparé : ajouter les positions ne change pas le reste du réseau généré
+    geo_rng = random.Random(f"geo-{seed}")
+    cities = [(geo_rng.uniform(43.0, 50.5), geo_rng.uniform(-1.5, 7.0)) for _ in range(100)]
+    medicines = []
+    for i in range(n_medicines):
+        name = f"{rng.choice(_WORDS)}{rng.choice(_SUFFIXES)} {rng.choice([100, 200, 250, 500, 1000])} #{i}"
+        description = f"{rng.choice(_FORMS).capitalize()} {rng.choice(_USES)}."
+        medicines.append(Medicine(name, description, max(1.0, round(rng.lognormvariate(2.1, 0.5), 2))))
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(n_medicines)))
+    schedules, weights = zip(*_SCHEDULES)
+
+    pharmacies = []
+    for i in range(n_pharmacies):
+        if rng.random() < sum(weights):
+            open_days = rng.choices(schedules, weights)[0]
+        else:
+            open_days = sorted(rng.sample(list(Day), rng.randint(1, 7)), key=lambda day: day.value)
+        size = min(n_medicines, max(1, int(rng.lognormvariate(math.log(median_catalog_size), 0.6))))
+        picked = dict.fromkeys(rng.choices(range(n_medicines), cum_weights=cum_weights, k=size * 2))
+        catalog = [medicines[index] for index in list(picked)[:size]]
+        if price_spread:
+            factor = 1 + rng.uniform(-price_spread, price_spread)
+            catalog = [Medicine(med.get_name(), med.get_description(), round(med.get_price() * factor, 2))
+                       for med in catalog]
+        street = rng.choice(["Rue", "Avenue", "Place", "Cours", "Boulevard"])
+        pharmacies.append(Pharmacy(f"Pharmacie {rng.choice(_WORDS)}{i}",
+                                   f"{rng.randint(1, 200)} {street} {rng.choice(_WORDS)}, pharmacie n°{i}",
+                                   open_days=open_days, catalog=catalog))
+        latitude, longitude = geo_rng.choice(cities)
+        pharmacies[-1].set_location((latitude + geo_rng.gauss(0, 0.1), longitude + geo_rng.gauss(0, 0.15)))
+    return pharmacies
+
+# 10. Recherche dans un catalogue
+class FilteredCatalog(Sequence):
+    """
+    Sous-ensemble d'un catalogue (positions retenues par une recherche), sans copier les médicaments.
+    """
+    def __init__(self, catalog, positions):
+        self._catalog = catalog
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._catalog[position] for position in self._positions[index]]
+        return self._catalog[self._positions[index]]
+
+class MedicineIndex:
+    """
+    Index de recherche sur le catalogue d'une pharmacie, construit une fois :
+    - trigrammes du nom et de la description (en minuscules) -> positions dans le catalogue ;
+    - prix triés, pour filtrer une fourchette de prix par dichotomie.
+    Une requête qui prolonge la précédente (saisie au clavier) ne filtre que le résultat précédent.
+    """
+    def __init__(self, catalog):
+        self._size = len(catalog)
+        self._texts = []
+        self._trigrams = {}  # Trigramme -> liste (croissante) des positions
+        prices = []
+        for position, med in enumerate(catalog):
+            text = f"{med.get_name()} {med.get_description()}".lower()
+            self._texts.append(text)
+            for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                self._trigrams.setdefault(trigram, []).append(position)
+            prices.append((med.get_price(), position))
+        prices.sort()
+        self._prices = [price for price, _ in prices]
+        self._price_positions = [position for _, position in prices]
+        # Dernière recherche (requête, positions), remplacée d'un bloc : l'index peut être
+        # interrogé depuis un thread de BackgroundWorker
+        self._last_search = ("", range(self._size))
+
+    def __len__(self):
+        return self._size
+
+    def _match_text(self, query):
+        if not query:
+            return range(self._size)
+        last_query, last_positions = self._last_search
+        if last_query and query.startswith(last_query):
+            # Saisie incrémentale : seul le résultat précédent peut encore correspondre
+            candidates = last_positions
+        elif len(query) >= 3:
+            postings = [self._trigrams.get(query[i:i + 3], ()) for i in range(len(query) - 2)]
+            candidates = min(postings, key=len)
+        else:
+            candidates = range(self._size)
+        return [position for position in candidates if query in self._texts[position]]
+
+    def search(self, query="", min_price=None, max_price=None):
+        """
+        Retourne les positions (dans l'ordre du catalogue) des médicaments dont le nom
+        ou la description contient query et dont le prix est dans [min_price, max_price].
+        """
+        query = query.strip().lower()
+        positions = self._match_text(query)
+        self._last_search = (query, positions)
+        if min_price is None and max_price is None:
+            return positions
+        low = 0 if min_price is None else bisect_left(self._prices, min_price)
+        high = len(self._prices) if max_price is None else bisect_right(self._prices, max_price)
+        if not query:
+            return sorted(self._price_positions[low:high])
+        in_range = set(self._price_positions[low:high])
+        return [position for position in positions if position in in_range]
+
+# 11. Disponibilité des médicaments dans le réseau de partenaires
+class AvailabilityIndex:
+    """
+    Index inversé médicament -> pharmacies qui le proposent (avec leur prix), trié par prix.
+    Croisé avec l'index par jour du PartnersSet, il répond à « qui a X ce jour-là,
+    du moins cher au plus cher » sans parcourir les pharmacies. L'index est reconstruit
+    si de nouveaux partenaires ont été ajoutés.
+    Il est construit et interrogé depuis les tâches de fond et corrigé par update_pharmacy
+    dans le thread Tk : un verrou protège les index, pas la construction (qui peut être longue) ;
+    une correction arrivée pendant une construction l'invalide, l'index sera reconstruit.
+    """
+    def __init__(self, partner_set):
+        self._partner_set = partner_set
+        self._offers = {}         # Nom du médicament (casefold) -> [(Pharmacy, Medicine)] trié par prix
+        self._offers_by_day = {}  # (nom, Day) -> tuple des offres des pharmacies ouvertes ce jour
+        self._stockists = {}      # (nom, Day ou None) -> frozenset des pharmacies (voir stockists)
+        self._ranks = {}
+        self._nb_partners = -1
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()  # Une seule construction à la fois
+        self._generation = 0                 # Incrémenté à chaque invalidation
+
+    def _ensure_built(self):
+        if self._nb_partners == len(self._partner_set.get_existing_partners()):
+            return
+        with self._build_lock:
+            if self._nb_partners == len(self._partner_set.get_existing_partners()):
+                return  # Construit entre-temps par un autre thread
+            with self._lock:
+                generation = self._generation
+            partners = list(self._partner_set.get_existing_partners())
+            offers = {}
+            for rank, pharmacy in enumerate(partners):
+                for med in pharmacy.get_catalog():
+                    offers.setdefault(med.get_name().casefold(), []).append((price_to_cents(med.get_price()), rank, pharmacy, med))
+            for key, entries in offers.items():
+                entries.sort(key=lambda entry: entry[:2])
+                offers[key] = [(pharmacy, med) for _, _, pharmacy, med in entries]
+            with self._lock:
+                self._offers = offers
+                self._offers_by_day = {}
+                self._stockists = {}
+                self._ranks = {pharmacy: rank for rank, pharmacy in enumerate(partners)}
+                # Invalidé pendant la construction : le résultat sert une fois, puis sera reconstruit
+                self._nb_partners = len(partners) if generation == self._generation else -1
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._nb_partners = -1
+
+    def update_pharmacy(self, pharmacy, changed_names, open_days_changed):
+        """
+        Met à jour l'index après une modification du catalogue d'une pharmacie : seules les offres
+        des médicaments changés sont retriées, et seuls les résultats en cache qui les concernent
+        (ou tous ceux de la pharmacie si ses jours d'ouverture ont changé) sont oubliés.
+        """
+        with self._lock:
+            if self._nb_partners != len(self._partner_set.get_existing_partners()):
+                # Index pas encore construit, ou en construction : celle-ci ne doit pas être gardée
+                self.invalidate()
+                return
+            catalog = {med.get_name().casefold(): med for med in pharmacy.get_catalog()}
+            keys = {name.casefold() for name in changed_names}
+            for key in keys:
+                # Les offres restent triées (prix, rang) : l'offre modifiée est retirée puis réinsérée par dichotomie
+                entries = [offer for offer in self._offers.get(key, ()) if offer[0] is not pharmacy]
+                if key in catalog:
+                    insort(entries, (pharmacy, catalog[key]),
+                           key=lambda offer: (price_to_cents(offer[1].get_price()), self._ranks[offer[0]]))
+                if entries:
+                    self._offers[key] = entries
+                else:
+                    self._offers.pop(key, None)
+            if open_days_changed:
+                keys.update(catalog)
+            for key in keys:
+                for day in Day:
+                    self._offers_by_day.pop((key, day), None)
+                    self._stockists.pop((key, day), None)
+                self._stockists.pop((key, None), None)
+
+    def cheapest_offers(self, med_name, day, limit=None):
+        """
+        Retourne les offres (Pharmacy, Medicine) des partenaires ouverts le jour day
+        qui proposent med_name, de la moins chère à la plus chère.
+        """
+        # L'index est construit avant de prendre _lock : _build_lock n'est jamais pris sous _lock
+        self._ensure_built()
+        with self._lock:
+            offers = self._cheapest_offers_locked(med_name.strip().casefold(), day)
+        return offers if limit is None else offers[:limit]
+
+    def _cheapest_offers_locked(self, name, day):
+        # Appelée sous _lock, l'index étant construit
+        key = (name, day)
+        offers = self._offers_by_day.get(key)
+        if offers is None:
+            open_partners = self._partner_set._partners_by_day[day]
+            offers = tuple([offer for offer in self._offers.get(name, ()) if offer[0] in open_partners])
+            self._offers_by_day[key] = offers
+        return offers
+
+    def stockists(self, med_name, day=None):
+        """
+        Retourne l'ensemble des pharmacies qui proposent med_name (ouvertes le jour day s'il est indiqué).
+        """
+        self._ensure_built()
+        name = med_name.strip().casefold()
+        with self._lock:
+            stockists = self._stockists.get((name, day))
+            if stockists is None:
+                offers = self._cheapest_offers_locked(name, day) if day is not None else self._offers.get(name, ())
+                stockists = self._stockists[(name, day)] = frozenset(pharmacy for pharmacy, _ in offers)
+        return stockists
+
+    def medicine_names(self):
+        self._ensure_built()
+        with self._lock:
+            return [offers[0][1].get_name() for offers in self._offers.values()]
+
+# 12. Répartition d'une liste de médicaments entre pharmacies
+class BasketOptimizer:
+    """
+    Répartit une liste de médicaments (nom, quantité) entre les partenaires ouverts un jour donné :
+    - objective="price" : chaque médicament chez le partenaire le moins cher (solution exacte) ;
+    - objective="pharmacies" : le moins de pharmacies possible, puis le prix le plus bas.
+      La recherche exacte (séparation et évaluation) est limitée aux petites listes et
+      à un budget de temps ; au-delà, on garde la solution gloutonne.
+    """
+    EXACT_MAX_ITEMS = 10
+
+    def __init__(self, availability):
+        self._availability = availability
+
+    def optimize(self, wanted, day, objective="price", budget=0.05):
+        """
+        wanted : liste de (nom du médicament, quantité). budget : temps maximal en secondes.
+        Retourne {'assignment': [(Pharmacy, Medicine, quantité)], 'total_cents', 'nb_pharmacies',
+        'missing': [noms introuvables], 'exact': bool}.
+        """
+        quantities = {}
+        for med_name, quantity in wanted:
+            quantities[med_name] = quantities.get(med_name, 0) + quantity
+        offers = {med_name: self._availability.cheapest_offers(med_name, day) for med_name in quantities}
+        missing = [med_name for med_name, med_offers in offers.items() if not med_offers]
+        offers = {med_name: med_offers for med_name, med_offers in offers.items() if med_offers}
+
+        exact = True
+        if objective == "pharmacies":
+            pharmacies, exact = self._fewest_pharmacies(offers, quantities, time.perf_counter() + budget)
+            # Offre la moins chère parmi les pharmacies retenues (les offres sont triées par prix)
+            choice = {med_name: next(offer for offer in med_offers if offer[0] in pharmacies)
+                      for med_name, med_offers in offers.items()}
+        else:
+            choice = {med_name: med_offers[0] for med_name, med_offers in offers.items()}
+
+        assignment = [(pharmacy, med, quantities[med_name]) for med_name, (pharmacy, med) in choice.items()]
+        return {
+            'assignment': assignment,
+            'total_cents': sum(quantity * price_to_cents(med.get_price()) for _, med, quantity in assignment),
+            'nb_pharmacies': len({pharmacy for pharmacy, _, _ in assignment}),
+            'missing': missing,
+            'exact': exact,
+        }
+
+    def _greedy(self, pharmacies_by_med):
+        """Couverture gloutonne : la pharmacie qui couvre le plus de médicaments restants d'abord."""
+        uncovered = set(pharmacies_by_med)
+        chosen = set()
+        while uncovered:
+            coverage = {}
+            for med_name in uncovered:
+                for pharmacy in pharmacies_by_med[med_name]:
+                    coverage[pharmacy] = coverage.get(pharmacy, 0) + 1
+            best = max(coverage, key=coverage.get)
+            chosen.add(best)
+            uncovered = {med_name for med_name in uncovered if best not in pharmacies_by_med[med_name]}
+        return chosen
+
+    def _fewest_pharmacies(self, offers, quantities, deadline):
+        """
+        Ensemble de pharmacies couvrant tous les médicaments : le plus petit, puis le moins cher
+        (chaque médicament au meilleur prix parmi les pharmacies retenues).
+        """
+        # Médicament -> {pharmacie: coût de la quantité demandée}, pharmacies dans l'ordre des prix croissants
+        costs = {}
+        for med_name, med_offers in offers.items():
+            med_costs = costs[med_name] = {}
+            for pharmacy, med in med_offers:
+                med_costs.setdefault(pharmacy, quantities[med_name] * price_to_cents(med.get_price()))
+
+        def total_cost(pharmacies):
+            return sum(min(med_costs[pharmacy] for pharmacy in pharmacies if pharmacy in med_costs)
+                       for med_costs in costs.values())
+
+        best = self._greedy(costs)
+        best_cost = total_cost(best)
+        if len(offers) > self.EXACT_MAX_ITEMS or not best:
+            return best, not best
+
+        complete = True
+
+        def consider(chosen):
+            nonlocal best, best_cost
+            cost = total_cost(chosen)
+            if len(chosen) < len(best) or cost < best_cost:
+                best, best_cost = set(chosen), cost
+
+        def search(uncovered, chosen, ties):
+            # ties=False : cherche moins de pharmacies ; ties=True : autant de pharmacies, moins cher
+            nonlocal complete
+            if not uncovered:
+                consider(chosen)
+                return
+            # Il faut au moins une pharmacie de plus : inutile si on ne peut plus faire mieux
+            if len(chosen) + 1 >= len(best) + ties:
+                return
+            if time.perf_counter() > deadline:
+                complete = False
+                return
+            # On branche sur le médicament proposé par le moins de pharmacies (les moins chères d'abord)
+            med_name = min(uncovered, key=lambda name: len(costs[name]))
+            if len(chosen) + 1 == len(best):
+                # Dernière pharmacie possible : elle doit proposer tous les médicaments restants
+                for pharmacy in costs[med_name]:
+                    if all(pharmacy in costs[name] for name in uncovered):
+                        chosen.append(pharmacy)
+                        consider(chosen)
+                        chosen.pop()
+                return
+            for pharmacy in costs[med_name]:
+                chosen.append(pharmacy)
+                search({name for name in uncovered if pharmacy not in costs[name]}, chosen, ties)
+                chosen.pop()
+
+        # D'abord le nombre minimal de pharmacies, puis la moins chère des couvertures de cette taille
+        search(set(costs), [], False)
+        if complete:
+            search(set(costs), [], True)
+        return best, complete
+
+    @staticmethod
+    def apply_to_cart(cart, result):
+        """
+        Ajoute la répartition au panier (une ligne par pharmacie et médicament).
+        Retourne les noms des médicaments refusés faute de stock.
+        """
+        refused = []
+        for pharmacy, med, quantity in result['assignment']:
+            try:
+                cart.add_to_cart(med, pharmacy.get_name(), quantity)
+            except ValueError:
+                refused.append(med.get_name())
+        return refused
+
+# Données de démonstration (utilisées par MyPharmApp et les benchmarks)
+def fake_pharmacies():
+    med1 = Medicine("Doliprane 500", "Antidouleur puissant base sur du paracétamol.", 8.5)
+    med2 = Medicine("Tamiflu", "Traitement contre la grippe.", 12.0)
+    med3 = Medicine("Euphon", "Sirop contre la toux", 7.5)
+    med4 = Medicine("Suppositoire.", "Facilite la digestion et le transit", 9.0)
+    med5 = Medicine("Xanax", "Anxiolytique, medicament contre le stress", 14.0)
+    med6 = Medicine("Pediakid", "Favorise l'endrmissement", 11.0)
+    med7 = Medicine("Rhinadvil", "Spray nasal lutte contre le nez encombré.", 6.5)
+    med8 = Medicine("Vitamine C", "Complément vitaminé pour réduire la fatigue.", 13.5)
+
+    pharm1 = Pharmacy("Pharmacie Bellevue", "13 Pl. Bellevue, Pharmacie centrale",
+                    open_days=[Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday],
+                    catalog=[med1, med2, med7])
+
+    pharm2 = Pharmacy("Pharmacie de la beraudiere", "27 Rue de la Beraudière, Pharmacie située en périphérie",
+                    open_days=[Day.Wednesday, Day.Thursday, Day.Friday, Day.Saturday],
+                    catalog=[med3, med4, med8])
+
+    pharm3 = Pharmacy("Pharmacie neyret fauriel", "67 Cr Fauriel, Petite pharmacie ouverte le week-end",
+                    open_days=[Day.Saturday, Day.Sunday],
+                    catalog=[med5, med6, med1])
+
+    pharm4 = Pharmacy("Pharmacie carnot", "21 Rue Bergson, Pharmacie de garde ouverte tous les jours",
+                    open_days=[Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday, Day.Saturday, Day.Sunday],
+                    catalog=[med2, med3, med5, med6, med7])
+
+    return [pharm1, pharm2, pharm3, pharm4]
+
+# 13. Localisation des pharmacies (géocodage local et index spatial)
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def distance_km(a, b):
+    """Distance (formule de haversine) entre deux positions (latitude, longitude) en degrés."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+def load_geocodes(path):
+    """
+    Lit un fichier de géocodage local (CSV : adresse,latitude,longitude) et retourne
+    un dictionnaire adresse (casefold) -> (latitude, longitude). Fichier absent : dictionnaire vide.
+    """
+    geocodes = {}
+    if not os.path.exists(path):
+        return geocodes
+    with open(path, encoding="utf-8", newline="") as geocode_file:
+        for row in csv.DictReader(geocode_file):
+            geocodes[row['adresse'].strip().casefold()] = (float(row['latitude']), float(row['longitude']))
+    return geocodes
+
+def locate_pharmacies(pharmacies, geocodes):
+    """
+    Place les pharmacies dont l'adresse figure dans geocodes. Retourne le nombre de pharmacies placées.
+    """
+    located = 0
+    for pharmacy in pharmacies:
+        location = geocodes.get(pharmacy.get_address().casefold())
+        if location is not None:
+            pharmacy.set_location(location)
+            located += 1
+    return located
+
+class GeoIndex:
+    """
+    Index spatial des partenaires : une grille de cellules de CELL_DEGREES degrés de côté.
+    Les k plus proches voisins d'un point sont cherchés anneau par anneau autour de sa cellule,
+    et la recherche s'arrête dès que l'anneau suivant est plus loin que le k-ième trouvé :
+    seules les cellules voisines sont visitées, quelle que soit la taille du réseau.
+    Filtres possibles : jour d'ouverture (index par jour du PartnersSet) et médicaments
+    proposés (AvailabilityIndex). L'index est reconstruit si de nouveaux partenaires ont été ajoutés.
+    """
+    CELL_DEGREES = 0.05       # Environ 5,5 km en latitude
+    BRUTE_FORCE_MAX = 512     # En dessous, les pharmacies candidates sont simplement triées
+
+    def __init__(self, partner_set, availability=None):
+        self._partner_set = partner_set
+        self._availability = availability
+        self._cells = {}          # (ligne, colonne) -> [((latitude, longitude), Pharmacy)]
+        self._bounds = (0, 0, 0, 0)
+        self._nb_partners = -1
+
+    def _cell(self, location):
+        return math.floor(location[0] / self.CELL_DEGREES), math.floor(location[1] / self.CELL_DEGREES)
+
+    def _build(self):
+        cells = {}
+        for pharmacy in self._partner_set.get_existing_partners():
+            location = pharmacy.get_location()
+            if location is not None:
+                cells.setdefault(self._cell(location), []).append((location, pharmacy))
+        self._cells = cells
+        rows = [row for row, _ in cells] or [0]
+        columns = [column for _, column in cells] or [0]
+        self._bounds = (min(rows), max(rows), min(columns), max(columns))
+        self._nb_partners = len(self._partner_set.get_existing_partners())
+
+    def invalidate(self):
+        self._nb_partners = -1
+
+    def _ring(self, row, column, radius):
+        if radius == 0:
+            yield row, column
+            return
+        for c in range(column - radius, column + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, column - radius
+            yield r, column + radius
+
+    def _ring_distance_km(self, latitude, radius):
+        """Distance minimale entre un point et l'anneau radius autour de sa cellule."""
+        if radius <= 1:
+            return 0.0
+        # Un degré de longitude est le plus court à la latitude la plus éloignée de l'équateur
+        farthest = min(89.9, abs(latitude) + (radius + 1) * self.CELL_DEGREES)
+        return (radius - 1) * self.CELL_DEGREES * KM_PER_DEGREE * math.cos(math.radians(farthest))
+
+    def nearest(self, location, k=5, day=None, medicines=()):
+        """
+        Retourne au plus k couples (distance en km, Pharmacy), du plus proche au plus éloigné,
+        parmi les partenaires placés, ouverts le jour day (si indiqué) et proposant tous les médicaments.
+        """
+        if k <= 0:
+            return []
+        if self._nb_partners != len(self._partner_set.get_existing_partners()):
+            self._build()
+        # Pharmacies proposant chaque médicament (ensembles gardés en cache), du plus petit au plus grand
+        required = sorted((self._availability.stockists(med_name, day) for med_name in medicines), key=len)
+        if required and len(required[0]) <= self.BRUTE_FORCE_MAX:
+            # Peu de candidats : ils sont triés directement
+            found = [(distance_km(location, p.get_location()), p) for p in required[0]
+                     if p.get_location() is not None and all(p in stockists for stockists in required[1:])]
+            found.sort(key=lambda entry: entry[0])
+            return found[:k]
+
+        open_partners = self._partner_set._partners_by_day[day] if day is not None else None
+        row, column = self._cell(location)
+        min_row, max_row, min_column, max_column = self._bounds
+        max_radius = max(abs(row - min_row), abs(row - max_row), abs(column - min_column), abs(column - max_column))
+        found = []
+        for radius in range(max_radius + 1):
+            if len(found) >= k and found[k - 1][0] <= self._ring_distance_km(location[0], radius):
+                break
+            for cell in self._ring(row, column, radius):
+                for pharmacy_location, pharmacy in self._cells.get(cell, ()):
+                    if open_partners is not None and pharmacy not in open_partners:
+                        continue
+                    if required and not all(pharmacy in stockists for stockists in required):
+                        continue
+                    found.append((distance_km(location, pharmacy_location), pharmacy))
+            found.sort(key=lambda entry: entry[0])
+            del found[k:]
+        return found
+
+# 14. Planification sur plusieurs jours (NumPy)
+class AvailabilityPlanner:
+    """
+    Répond en bloc, sur un horizon de plusieurs semaines, à « quand chaque pharmacie est-elle
+    ouverte ? » et « à partir de quand ce panier peut-il être servi ? ». Deux matrices NumPy :
+    - ouverture : pharmacies × 7 (booléens, colonne = Day.value) ;
+    - stock : pharmacies × médicaments, en bits (np.packbits, 8 médicaments par octet),
+      les colonnes étant les noms de médicaments (casefold).
+    Les requêtes sont calculées par jour de la semaine (produits de matrices), puis reportées
+    sur l'horizon. NumPy n'est importé qu'à la première requête.
+    L'index est reconstruit si de nouveaux partenaires ont été ajoutés. Comme pour
+    AvailabilityIndex, un verrou protège les matrices (requêtes des tâches de fond, corrections
+    de update_pharmacy) et une correction arrivée pendant une construction l'invalide.
+    """
+    CHUNK = 4096  # Pharmacies traitées à la fois pour construire la matrice de stock
+
+    def __init__(self, partner_set):
+        self._partner_set = partner_set
+        self._np = None
+        self._pharmacies = []
+        self._open = None      # Matrice pharmacies × 7 (bool)
+        self._stock = None     # Matrice pharmacies × ceil(médicaments / 8) (uint8, bits)
+        self._columns = {}     # Nom du médicament (casefold) -> colonne
+        self._rows = {}
+        self._nb_partners = -1
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._generation = 0
+
+    def _build(self):
+        with self._lock:
+            generation = self._generation
+        if self._np is None:
+            try:
+                import numpy
+            except ImportError:
+                raise ImportError("Le planificateur nécessite NumPy (pip install numpy)") from None
+            self._np = numpy
+        np = self._np
+        pharmacies = list(self._partner_set.get_existing_partners())
+        masks = np.array([pharmacy.get_open_days_mask() for pharmacy in pharmacies], dtype=np.uint8)
+        open_days = ((masks[:, None] >> np.arange(7, dtype=np.uint8)) & 1).astype(bool)
+
+        columns = {}
+        rows = []
+        for pharmacy in pharmacies:
+            rows.append([columns.setdefault(med.get_name().casefold(), len(columns)) for med in pharmacy.get_catalog()])
+        stock = np.zeros((len(pharmacies), (len(columns) + 7) // 8), dtype=np.uint8)
+        for first in range(0, len(pharmacies), self.CHUNK):
+            chunk = rows[first:first + self.CHUNK]
+            dense = np.zeros((len(chunk), len(columns)), dtype=bool)
+            lengths = [len(row) for row in chunk]
+            dense[np.repeat(np.arange(len(chunk)), lengths),
+                  np.fromiter((column for row in chunk for column in row), dtype=np.int64, count=sum(lengths))] = True
+            stock[first:first + len(chunk)] = np.packbits(dense, axis=1)
+        with self._lock:
+            self._open = open_days
+            self._pharmacies = pharmacies
+            self._rows = {pharmacy: row for row, pharmacy in enumerate(pharmacies)}
+            self._stock = stock
+            self._columns = columns
+            self._nb_partners = len(pharmacies) if generation == self._generation else -1
+
+    def _ensure_built(self):
+        if self._nb_partners == len(self._partner_set.get_existing_partners()):
+            return
+        with self._build_lock:
+            if self._nb_partners != len(self._partner_set.get_existing_partners()):
+                self._build()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._nb_partners = -1
+
+    def update_pharmacy(self, pharmacy, changed_names, open_days_changed):
+        """
+        Met à jour la ligne d'une pharmacie dans les deux matrices. Un médicament qui n'a encore
+        de colonne dans aucune pharmacie oblige à tout reconstruire (à la prochaine requête).
+        """
+        with self._lock:
+            if self._nb_partners != len(self._partner_set.get_existing_partners()):
+                self.invalidate()  # Pas encore construit, ou en construction : celle-ci ne doit pas être gardée
+                return
+            row = self._rows[pharmacy]
+            if open_days_changed:
+                self._open[row] = [pharmacy.is_open_on(day) for day in Day]
+            stocked = {med.get_name().casefold() for med in pharmacy.get_catalog()}
+            for name in changed_names:
+                key = name.casefold()
+                column = self._columns.get(key)
+                if column is None:
+                    if key in stocked:
+                        self.invalidate()
+                        return
+                    continue
+                bit = 0x80 >> (column & 7)
+                if key in stocked:
+                    self._stock[row, column >> 3] |= bit
+                else:
+                    self._stock[row, column >> 3] &= ~bit & 0xFF
+
+    def get_pharmacies(self):
+        """Pharmacies dans l'ordre des lignes des matrices (et des résultats de next_open_dates)."""
+        self._ensure_built()
+        return self._pharmacies
+
+    def _weekdays(self, start, horizon):
+        """Jour de la semaine (Day.value) de chacun des horizon jours à partir de start."""
+        np = self._np
+        return (start.weekday() + np.arange(horizon)) % 7
+
+    def stock_columns(self, med_names):
+        """
+        Extrait de la matrice de stock les colonnes des médicaments demandés
+        (pharmacies × len(med_names), bool). Un médicament inconnu donne une colonne vide.
+        """
+        self._ensure_built()
+        with self._lock:
+            return self._stock_columns_locked(med_names)
+
+    def _stock_columns_locked(self, med_names):
+        # Appelée sous _lock, les matrices étant construites
+        np = self._np
+        result = np.zeros((len(self._pharmacies), len(med_names)), dtype=bool)
+        for k, med_name in enumerate(med_names):
+            column = self._columns.get(med_name.strip().casefold())
+            if column is not None:
+                result[:, k] = (self._stock[:, column >> 3] >> (7 - (column & 7))) & 1
+        return result
+
+    def next_open_offsets(self, start, horizon=28):
+        """
+        Pour chaque pharmacie (ordre de get_pharmacies), nombre de jours entre start et sa prochaine
+        ouverture (0 si elle est ouverte ce jour-là), -1 si elle n'ouvre pas dans l'horizon.
+        """
+        self._ensure_built()
+        with self._lock:
+            open_on_horizon = self._open[:, self._weekdays(start, horizon)]
+            offsets = open_on_horizon.argmax(axis=1)
+            offsets[~open_on_horizon.any(axis=1)] = -1
+            return offsets
+
+    def next_open_dates(self, start, horizon=28):
+        """Comme next_open_offsets, mais avec des dates (None si pas d'ouverture dans l'horizon)."""
+        return [start + timedelta(days=int(offset)) if offset >= 0 else None
+                for offset in self.next_open_offsets(start, horizon)]
+
+    def first_full_dates(self, baskets, start, horizon=28, single_pharmacy=False):
+        """
+        Pour chaque panier (liste de noms de médicaments), première date à partir de start où il peut
+        être entièrement servi par les partenaires ouverts ce jour-là (par une seule pharmacie si
+        single_pharmacy), ou None dans l'horizon.
+        """
+        self._ensure_built()
+        with self._lock:
+            np = self._np
+            names = list(dict.fromkeys(name.strip().casefold() for basket in baskets for name in basket))
+            position = {name: k for k, name in enumerate(names)}
+            stock = self._stock_columns_locked(names)
+            open_days = self._open.astype(np.int32)
+            if not single_pharmacy:
+                # Médicament × jour de la semaine : nombre de pharmacies ouvertes qui le proposent
+                coverage = stock.T.astype(np.int32) @ open_days > 0
+            weekdays = self._weekdays(start, horizon)
+            results = []
+            for basket in baskets:
+                ks = [position[name.strip().casefold()] for name in basket]
+                if single_pharmacy:
+                    complete = stock[:, ks].all(axis=1)
+                    servable = self._open[complete].any(axis=0)
+                else:
+                    servable = coverage[ks].all(axis=0)
+                on_horizon = servable[weekdays]
+                results.append(start + timedelta(days=int(on_horizon.argmax())) if on_horizon.any() else None)
+            return results
+
+    def first_full_date(self, basket, start, horizon=28, single_pharmacy=False):
+        return self.first_full_dates([basket], start, horizon, single_pharmacy)[0]
+
+# 15. Mises à jour incrémentales du catalogue (fournisseur)
+class CatalogUpdater:
+    """
+    Applique en place les mises à jour envoyées par le fournisseur, une pharmacie à la fois :
+        {'pharmacy': nom, 'version': n,
+         'prices': {nom du médicament: prix}, 'add': [[nom, description, prix], ...],
+         'remove': [nom, ...], 'open_days': ["Monday", ...]}
+    (toutes les clés sauf 'pharmacy' sont facultatives). Chaque pharmacie a son numéro de version :
+    une mise à jour dont la version n'est pas plus récente est ignorée (renvoi, doublon).
+    Une mise à jour est vérifiée en entier avant d'être appliquée : invalide, elle ne change rien.
+    Un ajout d'un médicament déjà au catalogue le remplace (un nom n'apparaît qu'une fois par catalogue).
+    Seuls les index concernés sont corrigés : chaque objet de dependents (AvailabilityIndex,
+    AvailabilityPlanner, OrderService...) reçoit update_pharmacy(pharmacy, noms changés, jours changés),
+    et PartnersSet est tenu à jour par Pharmacy.set_open_days.
+    """
+    def __init__(self, partner_set, dependents=()):
+        self._partner_set = partner_set
+        self._dependents = list(dependents)
+
+    @staticmethod
+    def _check_price(price, med_name):
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or not 0 <= price < math.inf:
+            raise ValueError(f"Prix invalide pour {med_name} : {price!r}")
+        return price
+
+    def _parse(self, delta):
+        """
+        Vérifie une mise à jour et retourne (version, prix, ajouts (Medicine), retraits, jours d'ouverture ou None).
+        Lève ValueError si une partie est invalide.
+        """
+        version = delta.get('version')
+        if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+            raise ValueError(f"Version invalide : {version!r}")
+        prices = delta.get('prices', {})
+        if not isinstance(prices, dict):
+            raise ValueError(f"Prix invalides : {prices!r}")
+        for med_name, price in prices.items():
+            self._check_price(price, med_name)
+        added = []
+        for row in delta.get('add', ()):
+            if (not isinstance(row, (list, tuple)) or len(row) != 3
+                    or not isinstance(row[0], str) or not isinstance(row[1], str)):
+                raise ValueError(f"Ajout invalide : {row!r}")
+            added.append(Medicine(row[0], row[1], self._check_price(row[2], row[0])))
+        removed = list(delta.get('remove', ()))
+        if not all(isinstance(med_name, str) for med_name in removed):
+            raise ValueError(f"Retraits invalides : {removed!r}")
+        open_days = None
+        if 'open_days' in delta:
+            try:
+                open_days = [Day[name] for name in delta['open_days']]
+            except (KeyError, TypeError):
+                raise ValueError(f"Jours d'ouverture invalides : {delta['open_days']!r}") from None
+        return version, prices, added, removed, open_days
+
+    def apply(self, delta):
+        """
+        Applique une mise à jour. Retourne un dictionnaire {'pharmacy', 'applied', 'version',
+        'repriced': {nom: Medicine}, 'added', 'removed', 'open_days_changed'} ('repriced' contient
+        aussi les médicaments remplacés par un ajout). Lève ValueError, sans rien modifier,
+        si la pharmacie est inconnue ou si la mise à jour est invalide.
+        """
+        if not isinstance(delta, dict):
+            raise ValueError(f"Mise à jour invalide : {delta!r}")
+        pharmacy = self._partner_set.find_partner(delta.get('pharmacy'))
+        if pharmacy is None:
+            raise ValueError(f"Pharmacie inconnue : {delta.get('pharmacy')}")
+        version, prices, added, removed, open_days = self._parse(delta)
+        if version is None:
+            version = pharmacy.get_version() + 1
+        result = {'pharmacy': pharmacy, 'applied': False, 'version': pharmacy.get_version(),
+                  'repriced': {}, 'added': [], 'removed': [], 'open_days_changed': False}
+        if version <= pharmacy.get_version():
+            return result
+
+        for med_name, price in prices.items():
+            med = pharmacy.set_price(med_name, price)
+            if med is not None:
+                result['repriced'][med_name] = med
+        for med in added:
+            if pharmacy.replace_medicine(med):
+                result['repriced'][med.get_name()] = med
+            else:
+                pharmacy.add_medicine(med)
+                result['added'].append(med.get_name())
+        for med_name in removed:
+            if pharmacy.remove_medicine(med_name):
+                result['removed'].append(med_name)
+        if open_days is not None:
+            if days_to_mask(open_days) != pharmacy.get_open_days_mask():
+                pharmacy.set_open_days(open_days)
+                result['open_days_changed'] = True
+
+        pharmacy.set_version(version)
+        result['applied'] = True
+        result['version'] = version
+        changed_names = set(result['repriced']) | set(result['added']) | set(result['removed'])
+        for dependent in self._dependents:
+            dependent.update_pharmacy(pharmacy, changed_names, result['open_days_changed'])
+        return result
+
+    def apply_all(self, deltas):
+        return [self.apply(delta) for delta in deltas]
+
+# 16. Stocks des pharmacies et réservations (accès concurrents)
+def load_stocks(path, ledger):
+    """
+    Lit un fichier de stocks local (CSV : pharmacie,medicament,quantite) dans un StockLedger.
+    Fichier absent : aucun stock n'est suivi. Retourne le nombre de lignes lues.
+    """
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, encoding="utf-8", newline="") as stock_file:
+        for row in csv.DictReader(stock_file):
+            ledger.set_stock(row['pharmacie'], row['medicament'], int(row['quantite']))
+            count += 1
+    return count
+
+class StockLedger:
+    """
+    Stock disponible par (pharmacie, médicament) et réservations des paniers en cours.
+    Réserver retire la quantité du stock disponible (tout ou rien) ; libérer la rend ; valider
+    (commande passée) oublie la réservation, la quantité restant vendue. Un couple dont le stock
+    n'a jamais été fixé n'est pas suivi : les réservations y réussissent toujours.
+
+    Accès concurrents : les couples sont répartis entre STRIPES verrous (selon leur hash), deux
+    réservations sur des couples différents ne s'attendent donc presque jamais ; les réservations
+    de chaque détenteur (un panier) sont suivies de la même façon, sous des verrous séparés.
+    Un détenteur inactif depuis timeout secondes peut être libéré par expire().
+    """
+    STRIPES = 64
+
+    def __init__(self, timeout=15 * 60, stripes=STRIPES):
+        self._timeout = timeout
+        self._stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._available = [{} for _ in range(stripes)]   # (pharmacie, médicament) -> quantité disponible
+        self._reserved = [{} for _ in range(stripes)]    # (pharmacie, médicament) -> {détenteur: quantité}
+        self._holder_locks = [threading.Lock() for _ in range(stripes)]
+        self._holders = [{} for _ in range(stripes)]     # Détenteur -> [échéance, ensemble des couples]
+
+    def _stripe(self, key):
+        return hash(key) % self._stripes
+
+    def set_stock(self, pharm_name, med_name, quantity):
+        """Fixe la quantité disponible (hors réservations en cours)."""
+        key = (pharm_name, med_name)
+        i = self._stripe(key)
+        with self._locks[i]:
+            self._available[i][key] = quantity
+
+    def get_available(self, pharm_name, med_name):
+        """Quantité disponible, ou None si le stock de ce couple n'est pas suivi."""
+        key = (pharm_name, med_name)
+        return self._available[self._stripe(key)].get(key)
+
+    def get_reserved(self, pharm_name, med_name):
+        key = (pharm_name, med_name)
+        return sum(self._reserved[self._stripe(key)].get(key, {}).values())
+
+    def _touch(self, holder, key=None):
+        # Repousse l'échéance de holder ; il n'est enregistré qu'à sa première réservation suivie
+        i = self._stripe(holder)
+        with self._holder_locks[i]:
+            entry = self._holders[i].get(holder)
+            if entry is None:
+                if key is None:
+                    return
+                entry = self._holders[i][holder] = [0.0, set()]
+            entry[0] = time.monotonic() + self._timeout
+            if key is not None:
+                entry[1].add(key)
+
+    def reserve(self, holder, pharm_name, med_name, quantity=1):
+        """Réserve quantity exemplaires pour holder. Retourne False si le stock est insuffisant."""
+        key = (pharm_name, med_name)
+        i = self._stripe(key)
+        with self._locks[i]:
+            available = self._available[i].get(key)
+            if available is None:
+                tracked = False
+            elif available < quantity:
+                return False
+            else:
+                tracked = True
+                self._available[i][key] = available - quantity
+                reserved = self._reserved[i].setdefault(key, {})
+                reserved[holder] = reserved.get(holder, 0) + quantity
+        self._touch(holder, key if tracked else None)
+        return True
+
+    def release(self, holder, pharm_name, med_name, quantity=1):
+        """Rend au stock (au plus) quantity exemplaires réservés par holder. Retourne la quantité rendue."""
+        key = (pharm_name, med_name)
+        i = self._stripe(key)
+        with self._locks[i]:
+            released = self._take(i, key, holder, quantity)
+            if released:
+                self._available[i][key] += released
+        self._touch(holder)
+        return released
+
+    def _take(self, i, key, holder, quantity=None):
+        # Retire (au plus) quantity de la réservation de holder ; appelée sous le verrou i
+        reserved = self._reserved[i].get(key)
+        if not reserved or holder not in reserved:
+            return 0
+        taken = reserved[holder] if quantity is None else min(quantity, reserved[holder])
+        reserved[holder] -= taken
+        if reserved[holder] == 0:
+            del reserved[holder]
+            if not reserved:
+                del self._reserved[i][key]
+        return taken
+
+    def _forget(self, holder, restock):
+        i = self._stripe(holder)
+        with self._holder_locks[i]:
+            entry = self._holders[i].pop(holder, None)
+        result = {}
+        for key in entry[1] if entry else ():
+            j = self._stripe(key)
+            with self._locks[j]:
+                quantity = self._take(j, key, holder)
+                if quantity and restock:
+                    self._available[j][key] += quantity
+            if quantity:
+                result[key] = quantity
+        return result
+
+    def release_all(self, holder):
+        """Libère toutes les réservations de holder. Retourne {(pharmacie, médicament): quantité}."""
+        return self._forget(holder, restock=True)
+
+    def commit(self, holder):
+        """Valide les réservations de holder (commande passée). Retourne {(pharmacie, médicament): quantité}."""
+        return self._forget(holder, restock=False)
+
+    def expire(self, now=None):
+        """Libère les détenteurs inactifs depuis plus de timeout secondes et les retourne."""
+        now = time.monotonic() if now is None else now
+        expired = []
+        for i in range(self._stripes):
+            with self._holder_locks[i]:
+                expired += [holder for holder, (deadline, _) in self._holders[i].items() if deadline <= now]
+        for holder in expired:
+            self.release_all(holder)
+        return expired
+
+# 17. Journal des commandes (ajout seul, écriture groupée)
+class OrderJournal:
+    """
+    Journal local des commandes passées : une ligne JSON par commande, ajoutée en fin de fichier.
+    Durabilité :
+    - "always" : fsync après chaque commande ;
+    - "group"  : un thread d'écriture regroupe les commandes arrivées ensemble (jusqu'à group_size,
+                 ou pendant group_delay secondes) et fait un seul fsync pour tout le groupe ;
+                 append attend que sa commande soit sur disque (sauf wait=False) ;
+    - "none"   : écriture bufferisée, sans fsync.
+    """
+    def __init__(self, path, durability="group", group_size=256, group_delay=0.002):
+        if durability not in ("always", "group", "none"):
+            raise ValueError(f"Durabilité inconnue : {durability}")
+        self._path = path
+        self._durability = durability
+        self._group_size = group_size
+        self._group_delay = group_delay
+        self._records = []
+        self._next_seq = 0
+        for entry in self._read(path):
+            if 'seq' in entry:
+                self._records.append(entry)
+                self._next_seq = max(self._next_seq, entry['seq'] + 1)
+            else:
+                # Ligne d'en-tête écrite par compact : les numéros déjà attribués ne sont jamais réutilisés
+                self._next_seq = max(self._next_seq, entry.get('next_seq', 0))
+        self._synced_seq = self._next_seq - 1
+        # Une dernière ligne incomplète est retirée : sinon la prochaine commande y serait collée
+        self._truncate_partial_line(path)
+        self._pending = []  # Lignes en attente d'écriture (mode "group")
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()  # Exclut l'écriture d'un groupe pendant une compaction
+        self._closed = False
+        self._file = open(path, "a", encoding="utf-8")
+        self._committer = None
+        if durability == "group":
+            self._committer = threading.Thread(target=self._commit_loop, name="journal", daemon=True)
+            self._committer.start()
+
+    def get_records(self):
+        """Commandes relues au démarrage puis ajoutées depuis (dans l'ordre)."""
+        return self._records
+
+    @classmethod
+    def replay(cls, path):
+        """
+        Relit les commandes d'un journal. Une dernière ligne incomplète (arrêt brutal pendant l'écriture) est ignorée.
+        """
+        return (entry for entry in cls._read(path) if 'seq' in entry)
+
+    @staticmethod
+    def _truncate_partial_line(path, block_size=1 << 16):
+        """Tronque le fichier après son dernier saut de ligne (arrêt brutal pendant une écriture)."""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as journal_file:
+            end = journal_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - block_size)
+                journal_file.seek(start)
+                newline = journal_file.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                journal_file.truncate(position)
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def append(self, record, wait=True):
+        """
+        Ajoute une commande (dictionnaire sérialisable en JSON) et retourne son numéro de séquence.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError("Journal fermé")
+            seq = self._next_seq
+            self._next_seq += 1
+            record = dict(record, seq=seq)
+            self._records.append(record)
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            if self._durability == "group":
+                self._pending.append(line)
+                self._condition.notify_all()
+                while wait and self._synced_seq < seq:
+                    self._condition.wait()
+            else:
+                self._file.write(line)
+                if self._durability == "always":
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                self._synced_seq = seq
+        return seq
+
+    def _commit_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # Laisse un court délai pour regrouper les commandes qui arrivent en rafale
+                if len(self._pending) < self._group_size and not self._closed:
+                    self._condition.wait(self._group_delay)
+            with self._write_lock:
+                with self._condition:
+                    batch, self._pending = self._pending, []
+                    last_seq = self._next_seq - 1
+                if batch:
+                    self._file.write("".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                with self._condition:
+                    self._synced_seq = max(self._synced_seq, last_seq)
+                    self._condition.notify_all()
+
+    def flush(self):
+        """Attend que toutes les commandes ajoutées soient écrites (et synchronisées selon la durabilité)."""
+        with self._condition:
+            while self._synced_seq < self._next_seq - 1:
+                self._condition.wait()
+            if self._durability == "none":
+                self._file.flush()
+
+    def compact(self, keep=None):
+        """
+        Réécrit le journal avec les seules commandes retenues par keep(record) (toutes par défaut),
+        ce qui élimine aussi les lignes incomplètes. Le remplacement du fichier est atomique.
+        Le fichier réécrit commence par le prochain numéro de séquence ({"next_seq": n}), gardé
+        même si aucune commande n'est retenue.
+        """
+        self.flush()
+        with self._write_lock, self._condition:
+            if keep is not None:
+                self._records = [record for record in self._records if keep(record)]
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+                tmp_file.write(json.dumps({'next_seq': self._next_seq}) + "\n")
+                tmp_file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in self._records)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            self._file.close()
+            os.replace(tmp_path, self._path)
+            self._file = open(self._path, "a", encoding="utf-8")
+            # Les commandes encore en attente font partie du fichier réécrit
+            self._pending = []
+            self._synced_seq = self._next_seq - 1
+            self._condition.notify_all()
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._committer is not None:
+            self._committer.join()
+        self._file.close()
+
+# 18. Statistiques des commandes (stockage en colonnes, NumPy)
+class OrderLineStore:
+    """
+    Lignes de commandes passées, stockées en colonnes (tableaux NumPy) pour les statistiques :
+    numéro de commande (dense), jour de livraison (Day.value), pharmacie et médicament (codes,
+    noms dans des dictionnaires), quantité et prix unitaire en centimes. Alimentée par les
+    enregistrements du journal (OrderService.order_record), elle garde l'historique même après
+    compaction du journal. Les numéros de séquence sont suivis par source ("journal" local, ou
+    serveur de commandes d'un client léger) : chaque source a sa propre numérotation. Les regroupements se font par np.bincount, sans boucle Python.
+    save / load écrivent et relisent un répertoire de fichiers .npy (relus en mémoire partagée, mmap).
+    NumPy n'est importé qu'au premier usage.
+    """
+    COLUMNS = (("order", "int64"), ("day", "int8"), ("pharmacy", "int32"), ("medicine", "int32"),
+               ("quantity", "int32"), ("price", "int32"))
+
+    def __init__(self):
+        self._np = None
+        self._columns = None       # Nom de colonne -> tableau (capacité >= taille)
+        self._size = 0
+        self._nb_orders = 0
+        self._pharmacies = []      # Code -> nom
+        self._pharmacy_codes = {}
+        self._medicines = []
+        self._medicine_codes = {}
+        self._last_seqs = {}       # Source -> dernière commande intégrée
+        self._lock = threading.Lock()  # Ajouts (thread Tk) et requêtes (BackgroundWorker)
+        self._ingest_lock = threading.Lock()  # Un seul add_records à la fois (codes des noms)
+        self._save_lock = threading.Lock()    # Un seul save à la fois (fichiers temporaires)
+
+    def _numpy(self):
+        if self._np is None:
+            try:
+                import numpy
+            except ImportError:
+                raise ImportError("Les statistiques nécessitent NumPy (pip install numpy)") from None
+            self._np = numpy
+        return self._np
+
+    def __len__(self):
+        return self._size
+
+    def get_nb_orders(self):
+        return self._nb_orders
+    def get_last_seq(self, source="journal"):
+        return self._last_seqs.get(source, -1)
+    def get_pharmacy_names(self):
+        return self._pharmacies
+    def get_medicine_names(self):
+        return self._medicines
+
+    def _code(self, names, codes, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def extend(self, order, day, pharmacy, medicine, quantity, price):
+        """
+        Ajoute des lignes en bloc (un tableau par colonne, codes déjà attribués).
+        Les numéros de commande sont relatifs : ils sont décalés après les commandes déjà présentes.
+        """
+        np = self._numpy()
+        new = {"order": np.asarray(order) + self._nb_orders, "day": day, "pharmacy": pharmacy,
+               "medicine": medicine, "quantity": quantity, "price": price}
+        count = len(new["order"])
+        with self._lock:
+            if self._columns is None or self._size + count > len(self._columns["order"]):
+                # Capacité doublée (les colonnes relues en mmap sont alors copiées en mémoire)
+                capacity = max(1024, 2 * (self._size + count))
+                columns = {}
+                for name, dtype in self.COLUMNS:
+                    columns[name] = np.empty(capacity, dtype=dtype)
+                    if self._columns is not None:
+                        columns[name][:self._size] = self._columns[name][:self._size]
+                self._columns = columns
+            for name, _ in self.COLUMNS:
+                self._columns[name][self._size:self._size + count] = new[name]
+            self._size += count
+            if count:
+                self._nb_orders = int(self._columns["order"][self._size - 1]) + 1
+
+    def add_records(self, records, source="journal"):
+        """
+        Ajoute des commandes de source (celles déjà intégrées, d'après leur 'seq', sont ignorées).
+        Sans 'unit_prices_cents' (anciens enregistrements), le prix des lignes est inconnu (0).
+        """
+        with self._ingest_lock:
+            self._add_records(records, source)
+
+    def _add_records(self, records, source):
+        columns = ([], [], [], [], [], [])
+        order_count = 0
+        last_seq = self.get_last_seq(source)
+        for record in records:
+            seq = record.get('seq', last_seq + 1)
+            if seq <= last_seq:
+                continue
+            last_seq = seq
+            day = _parse_day(record.get('date', ""))
+            day = day.value if day is not None else -1
+            prices = record.get('unit_prices_cents') or [0] * len(record['items'])
+            for (pharm_name, med_name, quantity), price in zip(record['items'], prices):
+                for column, value in zip(columns, (order_count, day,
+                                                   self._code(self._pharmacies, self._pharmacy_codes, pharm_name),
+                                                   self._code(self._medicines, self._medicine_codes, med_name),
+                                                   quantity, price)):
+                    column.append(value)
+            order_count += 1
+        if columns[0]:
+            np = self._numpy()
+            self.extend(*(np.array(column, dtype=dtype) for column, (_, dtype) in zip(columns, self.COLUMNS)))
+        self._last_seqs[source] = last_seq
+
+    def add_record(self, record, source="journal"):
+        self.add_records([record], source)
+
+    def _snapshot(self):
+        # Vues sur les colonnes remplies : les ajouts suivants n'y touchent pas
+        with self._lock:
+            if self._columns is None:
+                self._numpy()
+                return {name: self._np.zeros(0, dtype=dtype) for name, dtype in self.COLUMNS}, 0
+            return {name: self._columns[name][:self._size] for name, _ in self.COLUMNS}, self._nb_orders
+
+    def revenue_by_pharmacy_day(self):
+        """
+        Chiffre d'affaires (centimes) par pharmacie et jour de livraison :
+        tableau pharmacies × 7 (lignes dans l'ordre de get_pharmacy_names, colonnes = Day.value).
+        """
+        np = self._numpy()
+        columns, _ = self._snapshot()
+        known = columns["day"] >= 0
+        cells = columns["pharmacy"][known].astype(np.int64) * 7 + columns["day"][known]
+        revenue = columns["quantity"][known].astype(np.int64) * columns["price"][known]
+        totals = np.bincount(cells, weights=revenue, minlength=len(self._pharmacies) * 7)
+        return totals.astype(np.int64).reshape(-1, 7)
+
+    def top_medicines(self, n=10, by="quantity", day=None):
+        """
+        Les n médicaments les plus vendus (by="quantity") ou qui rapportent le plus (by="revenue"),
+        éventuellement pour un seul jour de livraison. Retourne [(nom, valeur), ...].
+        """
+        np = self._numpy()
+        columns, _ = self._snapshot()
+        selected = slice(None) if day is None else columns["day"] == day.value
+        weights = columns["quantity"][selected].astype(np.int64)
+        if by == "revenue":
+            weights = weights * columns["price"][selected]
+        elif by != "quantity":
+            raise ValueError(f"Critère inconnu : {by}")
+        totals = np.bincount(columns["medicine"][selected], weights=weights, minlength=len(self._medicines))
+        n = min(n, len(totals))
+        if n <= 0:
+            return []
+        best = np.argpartition(totals, -n)[-n:]
+        best = best[np.argsort(totals[best])[::-1]]
+        return [(self._medicines[code], int(totals[code])) for code in best if totals[code] > 0]
+
+    def basket_sizes(self):
+        """
+        Distribution de la taille des paniers (nombre d'exemplaires par commande) :
+        tableau dont l'élément i est le nombre de commandes de i exemplaires.
+        """
+        np = self._numpy()
+        columns, nb_orders = self._snapshot()
+        sizes = np.bincount(columns["order"], weights=columns["quantity"], minlength=nb_orders).astype(np.int64)
+        return np.bincount(sizes)
+
+    def save(self, directory):
+        """
+        Écrit les colonnes (.npy) et les dictionnaires de noms (meta.json) dans directory.
+        Peut être appelée depuis le BackgroundWorker pendant que le thread Tk ajoute des commandes.
+        """
+        np = self._numpy()
+        with self._ingest_lock:
+            # Colonnes, noms et numéros de séquence cohérents entre eux
+            columns, nb_orders = self._snapshot()
+            meta = {'pharmacies': list(self._pharmacies), 'medicines': list(self._medicines),
+                    'last_seqs': dict(self._last_seqs), 'nb_orders': nb_orders}
+        with self._save_lock:
+            os.makedirs(directory, exist_ok=True)
+            # Fichiers temporaires renommés : les colonnes relues en mmap (load) restent valides
+            for name, _ in self.COLUMNS:
+                path = os.path.join(directory, f"{name}.npy")
+                with open(path + ".tmp", "wb") as column_file:
+                    np.save(column_file, columns[name])
+                os.replace(path + ".tmp", path)
+            tmp_path = os.path.join(directory, "meta.json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as meta_file:
+                json.dump(meta, meta_file, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Relit un répertoire écrit par save (store vide s'il n'existe pas)."""
+        store = cls()
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return store
+        np = store._numpy()
+        with open(meta_path, encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        store._columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                          for name, _ in cls.COLUMNS}
+        store._size = len(store._columns["order"])
+        store._nb_orders = meta['nb_orders']
+        store._pharmacies = meta['pharmacies']
+        store._pharmacy_codes = {name: code for code, name in enumerate(store._pharmacies)}
+        store._medicines = meta['medicines']
+        store._medicine_codes = {name: code for code, name in enumerate(store._medicines)}
+        store._last_seqs = meta['last_seqs']
+        return store
+
+# 19. Tâches en arrière-plan
+class BackgroundWorker:
+    """
+    Exécute les tâches longues (chargement de catalogue, recherches, disponibilités) dans un
+    pool de threads et renvoie leurs résultats dans le thread Tk via root.after.
+    Chaque tâche porte une clé : soumettre une nouvelle tâche avec la même clé annule la
+    précédente (elle n'est pas lancée si elle attendait encore, et son résultat est ignoré sinon).
+    """
+    POLL_MS = 20
+
+    def __init__(self, root, max_workers=2, on_busy=None):
+        self._root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mypharm")
+        self._results = queue.SimpleQueue()
+        self._jobs = {}            # Clé -> (future, jeton d'annulation, on_done, on_error)
+        self._on_busy = on_busy    # Appelée avec le nombre de tâches en cours
+        self._poll_after = None
+
+    def submit(self, key, func, *args, on_done=None, on_error=None):
+        """
+        Lance func(*args) hors du thread Tk ; on_done(résultat) ou on_error(exception)
+        sont appelées ensuite dans le thread Tk. Retourne le jeton d'annulation (threading.Event).
+        """
+        self.cancel(key)
+        token = threading.Event()
+        future = self._executor.submit(self._run, key, token, func, args)
+        self._jobs[key] = (future, token, on_done, on_error)
+        self._busy_changed()
+        if self._poll_after is None:
+            self._poll_after = self._root.after(self.POLL_MS, self._poll)
+        return token
+
+    def cancel(self, key):
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job[0].cancel()
+            job[1].set()
+            self._busy_changed()
+
+    def pending(self):
+        return len(self._jobs)
+
+    def shutdown(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key, token, func, args):
+        if token.is_set():
+            return
+        try:
+            self._results.put((key, token, True, func(*args)))
+        except Exception as error:
+            self._results.put((key, token, False, error))
+
+    def _busy_changed(self):
+        if self._on_busy is not None:
+            self._on_busy(len(self._jobs))
+
+    def _poll(self):
+        self._poll_after = None
+        while True:
+            try:
+                key, token, ok, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            job = self._jobs.get(key)
+            # Résultat d'une tâche annulée ou remplacée entre-temps : ignoré
+            if job is None or job[1] is not token or token.is_set():
+                continue
+            del self._jobs[key]
+            self._busy_changed()
+            callback = job[2] if ok else job[3]
+            try:
+                if callback is not None:
+                    callback(value)
+                elif not ok:
+                    raise value
+            except Exception as error:
+                # Signalée comme toute erreur de callback Tk, sans interrompre le traitement des autres résultats
+                self._root.report_callback_exception(type(error), error, error.__traceback__)
+        if self._jobs:
+            self._poll_after = self._root.after(self.POLL_MS, self._poll)
+
+# 20. Profilage des callbacks de l'interface (optionnel)
+class LatencyHistogram:
+    """
+    Histogramme à buckets log-linéaires (à la HDR Histogram) : valeurs entières (µs, nombre de
+    widgets...) exactes jusqu'à 63, puis 32 sous-buckets par puissance de 2 (précision ~3 %).
+    """
+    SUB_BITS = 5
+
+    def __init__(self):
+        self._counts = {}  # Index de bucket -> nombre de valeurs
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, value):
+        if value < 2 << cls.SUB_BITS:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        return (shift + 1) << cls.SUB_BITS | (value >> shift) - (1 << cls.SUB_BITS)
+
+    @classmethod
+    def _lower_bound(cls, index):
+        if index < 2 << cls.SUB_BITS:
+            return index
+        shift = (index >> cls.SUB_BITS) - 1
+        return ((index & ((1 << cls.SUB_BITS) - 1)) + (1 << cls.SUB_BITS)) << shift
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._lower_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count, 'min': self.min, 'max': self.max,
+            'mean': round(self.total / self.count, 1) if self.count else 0,
+            'p50': self.percentile(50), 'p90': self.percentile(90),
+            'p99': self.percentile(99), 'p999': self.percentile(99.9),
+        }
+
+class Profiler:
+    """
+    Mesures des callbacks de MyPharmApp : durée (µs), widgets créés et détruits par appel,
+    et retard de la boucle d'événements Tk (µs). Désactivé, il ne modifie rien : les méthodes
+    ne sont enveloppées que si le profilage est activé (--profile ou MYPHARM_PROFILE=1).
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._histograms = {}  # (nom, mesure) -> LatencyHistogram
+        self._lock = threading.Lock()  # Mesures des tâches (threads de BackgroundWorker) et snapshot
+
+    def histogram(self, name, metric):
+        key = (name, metric)
+        if key not in self._histograms:
+            self._histograms[key] = LatencyHistogram()
+        return self._histograms[key]
+
+    @staticmethod
+    def _widget_names(root):
+        names = set()
+        stack = [root]
+        while stack:
+            widget = stack.pop()
+            names.add(str(widget))
+            stack.extend(widget.winfo_children())
+        return names
+
+    def instrument(self, obj, root, method_names):
+        """
+        Remplace chaque méthode de obj par une version mesurée (seulement si le profilage est activé).
+        À appeler avant que les méthodes ne soient passées aux widgets (command=...).
+        """
+        if not self.enabled:
+            return
+        for name in method_names:
+            setattr(obj, name, self._wrap(name, getattr(obj, name), root))
+
+    def instrument_jobs(self, obj, method_names):
+        """
+        Comme instrument, pour les tâches exécutées par BackgroundWorker : seule la durée est
+        mesurée (les widgets ne sont pas parcourus hors du thread Tk).
+        """
+        if not self.enabled:
+            return
+        for name in method_names:
+            setattr(obj, name, self._wrap_job(name, getattr(obj, name)))
+
+    def _wrap_job(self, name, method):
+        durations = self.histogram(name, "wall_us")
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1e6
+                with self._lock:
+                    durations.record(elapsed)
+        return timed
+
+    def _wrap(self, name, method, root):
+        durations = self.histogram(name, "wall_us")
+        created = self.histogram(name, "widgets_created")
+        destroyed = self.histogram(name, "widgets_destroyed")
+
+        def timed(*args, **kwargs):
+            before = self._widget_names(root)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                durations.record((time.perf_counter() - start) * 1e6)
+                after = self._widget_names(root)
+                created.record(len(after - before))
+                destroyed.record(len(before - after))
+        return timed
+
+    def watch_event_lag(self, root, interval_ms=100):
+        """
+        Planifie un rappel toutes les interval_ms et mesure son retard : le temps pendant lequel
+        la boucle d'événements Tk était occupée.
+        """
+        if not self.enabled:
+            return
+        lag = self.histogram("tk_event_loop", "lag_us")
+        expected = [time.perf_counter() + interval_ms / 1000]
+
+        def tick():
+            now = time.perf_counter()
+            lag.record((now - expected[0]) * 1e6)
+            expected[0] = now + interval_ms / 1000
+            root.after(interval_ms, tick)
+        root.after(interval_ms, tick)
+
+    def snapshot(self):
+        result = {}
+        with self._lock:
+            for (name, metric), histogram in sorted(self._histograms.items()):
+                result.setdefault(name, {})[metric] = histogram.summary()
+        return result
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as profile_file:
+            json.dump(self.snapshot(), profile_file, indent=2, ensure_ascii=False)
+
+    def show_overlay(self, root, refresh_ms=1000):
+        """
+        Fenêtre de débogage qui affiche les mesures, rafraîchie toutes les refresh_ms.
+        """
+        overlay = tk.Toplevel(root)
+        overlay.title("Profilage")
+        overlay.geometry("720x360")
+        text_widget = tk.Text(overlay, wrap="none", font=("Courier", 9))
+        text_widget.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            if not overlay.winfo_exists():
+                return
+            lines = [f"{'callback':<28}{'mesure':<20}{'n':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"]
+            for name, metrics in self.snapshot().items():
+                for metric, summary in metrics.items():
+                    lines.append(f"{name:<28}{metric:<20}{summary['count']:>7}{summary['p50']:>9}"
+                                 f"{summary['p90']:>9}{summary['p99']:>9}{summary['max'] or 0:>9}")
+            text_widget.config(state="normal")
+            text_widget.delete("1.0", tk.END)
+            text_widget.insert("1.0", "\n".join(lines))
+            text_widget.config(state="disabled")
+            overlay.after(refresh_ms, refresh)
+        refresh()
+
+# 21. Service multi-sessions (asyncio) et client léger
+class ServerSession:
+    """
+    État propre à une connexion (un poste de comptoir) : informations de livraison,
+    partenaires ouverts le jour de livraison et panier. Le catalogue, lui, est partagé.
+    """
+    __slots__ = ("deliv_info", "partners", "cart")
+
+    def __init__(self, stock=None):
+        self.deliv_info = DeliveryInfo()
+        self.partners = ()
+        self.cart = Cart(stock)
+
+class OrderServer:
+    """
+    Sert de nombreux postes depuis un seul processus : un protocole ligne à ligne sur socket TCP,
+    une requête JSON par ligne ({'op': ..., paramètres}) et une réponse JSON par ligne
+    ({'ok': True, ...} ou {'ok': False, 'error': ...}). Chaque connexion est une session.
+
+    Toutes les sessions partagent le même réseau de pharmacies, qui n'est jamais modifié :
+    les partenaires du jour et la pharmacie choisie sont gardés dans la session
+    (et non dans le PartnersSet, via update_available_by_day / set_active_partner).
+
+    Opérations :
+        pharmacies                               -> toutes les pharmacies [id, nom, description, jours]
+        delivery  name, first_name, date         -> jour et partenaires ouverts ce jour-là
+        partners  [day]                          -> partenaires ouverts (jour de livraison par défaut)
+        catalog   pharmacy, [query, offset, limit] -> médicaments [id, nom, description, prix en centimes]
+        medicine  id                             -> [nom, description, prix en centimes]
+        add / remove  pharmacy, medicine, [quantity] -> panier
+        cart                                     -> panier
+        clear                                    -> panier vidé (réservations libérées)
+        order     [name, first_name, date, items] -> ticket (panier de la session si items est absent)
+    Une pharmacie est désignée par son id (voir pharmacies) ou par son nom.
+    """
+    EXPIRE_S = 30  # Libération des paniers inactifs (voir StockLedger.expire)
+
+    def __init__(self, pharmacies, journal=None, stock=None):
+        self._pharmacies = list(pharmacies)
+        self._partner_set = PartnersSet(self._pharmacies)
+        self._service = OrderService(self._partner_set)
+        self._ids = {pharmacy: pharmacy_id for pharmacy_id, pharmacy in enumerate(self._pharmacies)}
+        self._search_indexes = {}  # Pharmacy -> MedicineIndex (construit à la première recherche)
+        self._served_ids = {}  # Pharmacy -> {clé du médicament: identifiant MEDICINES} (voir _medicine_ids)
+        self._journal = journal
+        self._stock = stock  # StockLedger partagé par les sessions (facultatif)
+        self._handlers = {
+            "pharmacies": self._op_pharmacies, "delivery": self._op_delivery, "partners": self._op_partners,
+            "catalog": self._op_catalog, "medicine": self._op_medicine, "add": self._op_add,
+            "remove": self._op_remove, "cart": self._op_cart, "clear": self._op_clear,
+        }
+        self.nb_sessions = 0
+        self.nb_requests = 0
+        self._expire_task = None
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """Démarre le serveur et retourne l'asyncio.Server (à attendre avec serve_forever)."""
+        if self._stock is not None:
+            self._expire_task = asyncio.get_running_loop().create_task(self._expire_carts())
+        return await asyncio.start_server(self._handle, host, port, limit=1 << 20)
+
+    async def _expire_carts(self):
+        while True:
+            await asyncio.sleep(self.EXPIRE_S)
+            for cart in self._stock.expire():
+                cart.clear()
+
+    async def _handle(self, reader, writer):
+        session = ServerSession(self._stock)
+        self.nb_sessions += 1
+        try:
+            while True:
+                line = await self._read_request(reader)
+                if line is None:
+                    break
+                if line:
+                    response = await self.dispatch(session, line)
+                else:
+                    response = {'ok': False, 'error': "Requête trop longue"}
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.nb_sessions -= 1
+            session.cart.clear()  # Les réservations d'une session fermée sont libérées
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """
+        Lit la ligne suivante. Retourne None en fin de connexion, et b"" pour une ligne plus longue
+        que la limite du flux : elle est ignorée jusqu'à son saut de ligne, la connexion continue.
+        """
+        overrun = False
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as error:
+                return error.partial if error.partial and not overrun else None
+            except asyncio.LimitOverrunError as error:
+                # Les octets déjà reçus de la ligne trop longue sont jetés, puis la suite jusqu'au saut de ligne
+                overrun = True
+                await reader.readexactly(error.consumed)
+                continue
+            return b"" if overrun else line
+
+    async def dispatch(self, session, line):
+        """Traite une ligne de requête et retourne la réponse (dictionnaire)."""
+        self.nb_requests += 1
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == "order":
+                # Seule opération qui attend : l'écriture dans le journal se fait hors de la boucle
+                return await self._op_order(session, request)
+            handler = self._handlers.get(op)
+            if handler is None:
+                raise ValueError(f"Opération inconnue : {op}")
+            return handler(session, request)
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError) as error:
+            return {'ok': False, 'error': str(error)}
+
+    def _pharmacy(self, request):
+        if isinstance(request['pharmacy'], str):
+            pharmacy = self._service.get_partner_set().find_partner(request['pharmacy'])
+            if pharmacy is None:
+                raise ValueError(f"Pharmacie inconnue : {request['pharmacy']}")
+            return pharmacy
+        pharmacy_id = request['pharmacy']
+        if isinstance(pharmacy_id, bool) or not isinstance(pharmacy_id, int) or not 0 <= pharmacy_id < len(self._pharmacies):
+            raise ValueError(f"Pharmacie inconnue : {pharmacy_id!r}")
+        return self._pharmacies[pharmacy_id]
+
+    @staticmethod
+    def _count(request, key, default):
+        value = request.get(key, default)
+        if value is not default and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            raise ValueError(f"{key} invalide : {value!r}")
+        return value
+
+    def _partners(self, partners):
+        return [[self._ids[p], p.get_name(), p.get_description(), p.get_open_days_mask()] for p in partners]
+
+    def _cart(self, cart):
+        return {'ok': True, 'total_cents': cart.get_total_cents(),
+                'lines': [[pharm, med_name, info['quantity'], price_to_cents(info['med'].get_price())]
+                          for pharm, meds in cart.get_lines().items() for med_name, info in meds.items()]}
+
+    def _op_pharmacies(self, session, request):
+        return {'ok': True, 'pharmacies': self._partners(self._pharmacies)}
+
+    def _op_delivery(self, session, request):
+        deliv_info = DeliveryInfo(request.get('name', ""), request.get('first_name', ""), request.get('date', ""))
+        if not deliv_info.get_name() or not deliv_info.get_first_name():
+            raise ValueError("Veuillez remplir tous les champs.")
+        day = deliv_info.get_day()
+        if day is None:
+            raise ValueError("Date invalide, impossible de déterminer le jour.")
+        session.deliv_info = deliv_info
+        session.partners = self._partner_set.get_partners_by_day(day)
+        return {'ok': True, 'day': day.name, 'partners': self._partners(session.partners)}
+
+    def _op_partners(self, session, request):
+        if 'day' in request:
+            return {'ok': True, 'partners': self._partners(self._partner_set.get_partners_by_day(Day[request['day']]))}
+        return {'ok': True, 'partners': self._partners(session.partners)}
+
+    def _op_catalog(self, session, request):
+        pharmacy = self._pharmacy(request)
+        catalog = pharmacy.get_catalog()
+        query = request.get('query', "")
+        if query:
+            index = self._search_indexes.get(pharmacy)
+            if index is None:
+                index = self._search_indexes[pharmacy] = MedicineIndex(catalog)
+            meds = FilteredCatalog(catalog, index.search(query))
+        else:
+            meds = catalog
+        offset = self._count(request, 'offset', 0)
+        limit = self._count(request, 'limit', None)
+        page = meds[offset:offset + limit if limit is not None else len(meds)]
+        return {'ok': True, 'total': len(meds),
+                'medicines': [[medicine_id, med.get_name(), med.get_description(), price_to_cents(med.get_price())]
+                              for medicine_id, med in zip(self._medicine_ids(pharmacy, page), page)]}
+
+    def _medicine_ids(self, pharmacy, page):
+        """
+        Identifiants MEDICINES des médicaments de page. Le serveur garde une référence sur chaque
+        médicament du catalogue servi ; quand le catalogue a changé, ces références sont reprises
+        sur le catalogue courant et les anciennes rendues (les prix remplacés ne restent pas dans la table).
+        """
+        served = self._served_ids.get(pharmacy, {})
+        if any(MedicineTable.key(med) not in served for med in page):
+            previous = served
+            served = self._served_ids[pharmacy] = {}
+            for med in pharmacy.get_catalog():
+                key = MedicineTable.key(med)
+                if key not in served:
+                    served[key] = MEDICINES.intern(med)
+            for medicine_id in previous.values():
+                MEDICINES.release(medicine_id)
+        return [served[MedicineTable.key(med)] for med in page]
 
-    def get_name(self):
-        return self._name
-    def set_name(self, name):
-        self._name = name
+    def _op_medicine(self, session, request):
+        med = MEDICINES.get(request['id'])
+        return {'ok': True, 'medicine': [med.get_name(), med.get_description(), price_to_cents(med.get_price())]}
 
-    def get_first_name(self):
-        return self._first_name
-    def set_first_name(self, first_name):
-        self._first_name = first_name
+    def _op_add(self, session, request):
+        pharmacy = self._pharmacy(request)
+        day = session.deliv_info.get_day()
+        if day is not None and not self._partner_set.is_open(pharmacy, day):
+            raise ValueError(f"Pharmacie indisponible le {day.name} : {pharmacy.get_name()}")
+        med = self._service._find_medicine(pharmacy, request['medicine'])
+        if med is None:
+            raise ValueError(f"Médicament introuvable chez {pharmacy.get_name()} : {request['medicine']}")
+        quantity = check_quantity(request.get('quantity', 1), minimum=1)
+        session.cart.add_to_cart(med, pharmacy.get_name(), quantity)  # ValueError si stock insuffisant
+        return self._cart(session.cart)
 
-    def get_date(self):
-        return self._date
-    def set_date(self, date_str):
-        self._date = date_str
-        self._day = self.compute_day(date_str)
+    def _op_remove(self, session, request):
+        pharmacy = self._pharmacy(request)
+        quantity = check_quantity(request.get('quantity', 1), minimum=1)
+        info = session.cart.get_line(pharmacy.get_name(), request['medicine'])
+        if info is not None:
+            session.cart.remove_from_cart(info['med'], pharmacy.get_name(), quantity)
+        return self._cart(session.cart)
 
-    def get_day(self):
-        return self._day
+    def _op_cart(self, session, request):
+        return self._cart(session.cart)
 
-    def __str__(self):
-        day_str = self._day.name if self._day else "Inconnu"
-        return f"{self._first_name} {self._name} - Date: {self._date} ({day_str})"
+    def _op_clear(self, session, request):
+        session.cart.clear()
+        return self._cart(session.cart)
 
-# 3. Classe Medicine
-class Medicine:
-    def __init__(self, name, description, price):
-        self._name = name
-        self._description = description
-        self._price = price
+    async def _op_order(self, session, request):
+        reservations = session.cart
+        if 'items' not in request:
+            # Panier de la session ; les informations de livraison peuvent être données avec la commande
+            deliv_info = session.deliv_info
+            request = {'name': request.get('name', deliv_info.get_name()),
+                       'first_name': request.get('first_name', deliv_info.get_first_name()),
+                       'date': request.get('date', deliv_info.get_date()),
+                       'items': [(pharm, med_name, info['quantity']) for pharm, meds in session.cart.get_lines().items()
+                                 for med_name, info in meds.items()]}
+        else:
+            # Commande complète envoyée d'un bloc (client léger) : le stock est réservé ici
+            reservations = Cart(self._stock)
+        deliv_info, cart = self._service.build_order(request)
+        if cart.get_nb_med() == 0:
+            raise ValueError("Le panier est vide.")
+        if reservations is not session.cart:
+            try:
+                for pharm, meds in cart.get_lines().items():
+                    for info in meds.values():
+                        reservations.add_to_cart(info['med'], pharm, info['quantity'])
+            except ValueError:
+                reservations.clear()
+                raise
+        if self._stock is not None:
+            self._stock.commit(reservations)
+        reservations.clear()
+        seq = None
+        record = self._service.order_record(deliv_info, cart)
+        if self._journal is not None:
+            seq = await asyncio.get_running_loop().run_in_executor(None, self._journal.append, record)
+        # Lignes et prix retenus par le serveur : le client les affiche et les garde pour ses statistiques
+        return {'ok': True, 'seq': seq, 'total_cents': cart.get_total_cents(),
+                'items': record['items'], 'unit_prices_cents': record['unit_prices_cents'],
+                'ticket': self._service.build_ticket_lines(deliv_info, cart)}
 
-    def get_name(self):
-        return self._name
-    def get_description(self):
-        return self._description
-    def get_price(self):
-        return self._price
+def run_server(pharmacies, host="127.0.0.1", port=8765, journal_path=None, stock_path=None):
+    """Lance un OrderServer jusqu'à l'interruption du processus."""
+    journal = OrderJournal(journal_path) if journal_path else None
+    stock = None
+    if stock_path:
+        stock = StockLedger()
+        load_stocks(stock_path, stock)
 
-    def __str__(self):
-        return f"{self._name} : {self._description} - {self._price} €"
+    async def main():
+        server = await OrderServer(pharmacies, journal, stock).serve(host, port)
+        async with server:
+            await server.serve_forever()
 
-# 4.Classe Pharmacy
-class Pharmacy:
-    def __init__(self, name, description, open_days=None, catalog=None):
-        self._name = name
-        self._description = description
-        self._open_days = open_days if open_days else []
-        self._catalog = catalog if catalog else []
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if journal is not None:
+            journal.close()
 
-    def get_name(self):
-        return self._name
-    def get_description(self):
-        return self._description
-    def get_open_days(self):
-        return self._open_days
-    def set_open_days(self, open_days):
-        self._open_days = open_days
-    def get_catalog(self):
-        return self._catalog
-    def add_medicine(self, med):
-        self._catalog.append(med)
+class ServiceClient:
+    """
+    Client (bloquant) d'un OrderServer. Il offre aussi l'interface de lecture de CatalogStore
+    (load_pharmacies, get_catalog_ids, get_medicine) : MyPharmApp peut ainsi charger le réseau
+    depuis le serveur au lieu d'une copie locale. Utilisable depuis plusieurs threads.
+    """
+    def __init__(self, host="127.0.0.1", port=8765, timeout=10):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._socket.makefile("rwb")
+        self._lock = threading.Lock()
+        self._medicines = {}  # Identifiant -> Medicine déjà créé
 
-    def __str__(self):
-        days = ', '.join(day.name for day in self._open_days)
-        return f"Pharmacie {self._name} (Ouverte: {days})"
+    def close(self):
+        self._file.close()
+        self._socket.close()
 
-# 5. Classe PartnersSet
-class PartnersSet:
-    def __init__(self, existing_partners=None):
-        self._existing_partners = existing_partners if existing_partners else []  # Liste de Pharmacy
-        self._available_partners = []
-        self._active_partner = None
+    def call(self, op, **params):
+        """Envoie une requête et retourne la réponse. Lève ValueError si le serveur la refuse."""
+        with self._lock:
+            self._file.write(json.dumps(dict(params, op=op), ensure_ascii=False).encode() + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connexion au serveur fermée")
+        response = json.loads(line)
+        if not response['ok']:
+            raise ValueError(response['error'])
+        return response
 
-    def get_existing_partners(self):
-        return self._existing_partners
-    def get_available_partners(self):
-        return self._available_partners
-    def get_active_partner(self):
-        return self._active_partner
-    def set_active_partner(self, partner):
-        self._active_partner = partner
+    def load_pharmacies(self):
+        return [StoredPharmacy(self, pharmacy_id, name, description, open_days)
+                for pharmacy_id, name, description, open_days in self.call("pharmacies")['pharmacies']]
 
-    def update_available_by_day(self, day):
+    def get_catalog_ids(self, pharmacy_id):
+        ids = []
+        for medicine_id, name, description, price_cents in self.call("catalog", pharmacy=pharmacy_id)['medicines']:
+            if medicine_id not in self._medicines:
+                self._medicines[medicine_id] = Medicine(name, description, price_cents / 100)
+            ids.append(medicine_id)
+        return ids
+
+    def get_medicine(self, medicine_id):
+        med = self._medicines.get(medicine_id)
+        if med is None:
+            name, description, price_cents = self.call("medicine", id=medicine_id)['medicine']
+            med = self._medicines[medicine_id] = Medicine(name, description, price_cents / 100)
+        return med
+
+class RemoteStock:
+    """
+    Réservations d'un client léger, faites par le serveur dans le panier de sa session, si bien
+    que tous les postes réservent sur le même stock. Les appels au serveur ne se font jamais dans
+    le thread Tk : request (à lancer en tâche de fond) réserve sur le serveur, puis Cart consomme
+    ces quantités confirmées par reserve ; release, release_all et la détection des paniers
+    expirés sont envoyés en tâche de fond par submit (voir BackgroundWorker.submit, sans la clé).
+    Même interface que StockLedger pour Cart (reserve, release, release_all, commit, expire).
+    La commande est passée avec le panier de la session (op "order" sans items).
+    """
+    def __init__(self, client, submit):
+        self._client = client
+        self._submit = submit
+        self._lock = threading.Lock()  # request et le contrôle d'expiration tournent hors du thread Tk
+        self._granted = {}    # (panier, pharmacie, médicament) -> quantité réservée, pas encore dans le panier
+        self._holders = set()  # Paniers locaux qui ont des réservations sur le serveur
+        self._expired = set()  # Paniers vidés par le serveur, vus par le dernier contrôle
+        self._changes = 0      # Réservations confirmées (un contrôle plus ancien est ignoré)
+
+    def _call(self, op, **params):
+        try:
+            return self._client.call(op, **params)
+        except OSError as error:
+            raise ValueError(f"Serveur injoignable : {error}") from None
+
+    def request(self, holder, items):
         """
-        Met à jour la liste des partenaires disponibles en fonction du jour passé.
+        Réserve sur le serveur les lignes (pharmacie, médicament, quantité) ; appel bloquant, hors du
+        thread Tk. Retourne les refus [(médicament, message)] ; les quantités confirmées sont ensuite
+        ajoutées au panier (Cart.add_to_cart) dans le thread Tk.
         """
-        self._available_partners = [
-            p for p in self._existing_partners if day in p.get_open_days()
-        ]
+        refused = []
+        for pharm_name, med_name, quantity in items:
+            try:
+                self._call("add", pharmacy=pharm_name, medicine=med_name, quantity=quantity)
+            except ValueError as error:
+                refused.append((med_name, str(error)))
+                continue
+            with self._lock:
+                key = (holder, pharm_name, med_name)
+                self._granted[key] = self._granted.get(key, 0) + quantity
+                self._holders.add(holder)
+                self._changes += 1
+        return refused
 
-    def __str__(self):
-        partners = ', '.join(p.get_name() for p in self._available_partners)
-        return f"Partenaires disponibles: {partners}"
+    def reserve(self, holder, pharm_name, med_name, quantity=1):
+        # Seules les quantités déjà confirmées par request peuvent entrer dans le panier
+        key = (holder, pharm_name, med_name)
+        with self._lock:
+            granted = self._granted.get(key, 0)
+            if granted < quantity:
+                return False
+            if granted > quantity:
+                self._granted[key] = granted - quantity
+            else:
+                del self._granted[key]
+        return True
 
-# 6. Classe Cart
-class Cart:
-    def __init__(self):
-        self._order = []
-        self._nb_med = 0
-        self._total_price = 0.0
+    def _send(self, op, **params):
+        # Serveur injoignable : tant pis, la session fermée libère tout
+        try:
+            self._call(op, **params)
+        except ValueError:
+            pass
 
-    def add_to_cart(self, med):
-        self._order.append(med)
-        self._nb_med += 1
-        self._total_price += med.get_price()
+    def release(self, holder, pharm_name, med_name, quantity=1):
+        self._submit(self._send, "remove", pharmacy=pharm_name, medicine=med_name, quantity=quantity)
+        return quantity
 
-    def remove_from_cart(self, med):
-        if med in self._order:
-            self._order.remove(med)
-            self._nb_med -= 1
-            self._total_price -= med.get_price()
+    def _forget(self, holder):
+        with self._lock:
+            self._holders.discard(holder)
+            self._expired.discard(holder)
+            for key in [key for key in self._granted if key[0] is holder]:
+                del self._granted[key]
 
-    def get_nb_med(self):
-        return self._nb_med
-    def get_total_price(self):
-        return self._total_price
-    def get_order(self):
-        return self._order
+    def release_all(self, holder):
+        if holder in self._holders:
+            self._forget(holder)
+            self._submit(self._send, "clear")
+        return {}
 
-    def __str__(self):
-        meds = ', '.join(med.get_name() for med in self._order)
-        return f"{self._nb_med} médicaments ({meds}) - Total: {self._total_price} €"
+    def commit(self, holder):
+        # Les réservations ont été validées par le serveur avec la commande
+        self._forget(holder)
+        return {}
+
+    def _check_expired(self, holders, changes):
+        try:
+            lines = self._client.call("cart")['lines']
+        except (ValueError, OSError):
+            return
+        with self._lock:
+            if not lines and changes == self._changes:
+                self._expired.update(holder for holder in holders if holder in self._holders)
+
+    def expire(self, now=None):
+        """
+        Retourne les paniers dont la session a été vidée par le serveur (inactivité), d'après le
+        contrôle précédent, et en lance un nouveau en tâche de fond.
+        """
+        with self._lock:
+            expired = [holder for holder in self._expired if holder in self._holders]
+            holders, changes = [holder for holder in self._holders if holder not in self._expired], self._changes
+            self._expired.clear()
+        for holder in expired:
+            self._forget(holder)
+        if holders:
+            self._submit(self._check_expired, holders, changes)
+        return expired
 
-# 7. Classe MyPharmApp (Intreface et organisation des actions)
+# 22. Classe MyPharmApp (Intreface et organisation des actions)
 class MyPharmApp:
-    def __init__(self, root):
+    MED_ROW_HEIGHT = 130  # Hauteur (en pixels) d'une ligne de la liste des médicaments
+    JOURNAL_RETENTION_DAYS = 365  # Les commandes plus anciennes sont retirées du journal à la compaction
+    JOURNAL_COMPACT_MS = 60 * 60 * 1000  # Compaction du journal toutes les heures
+    DELTAS_POLL_MS = 60 * 1000  # Lecture des nouvelles mises à jour du fournisseur toutes les minutes
+    STATS_PATH = "commandes.stats"  # Historique des commandes en colonnes (voir OrderLineStore)
+    STOCK_PATH = "stocks.csv"  # Stocks des pharmacies (pharmacie,medicament,quantite) ; absent : non suivis
+    CART_TIMEOUT_S = 15 * 60   # Un panier inactif depuis 15 minutes libère ses réservations
+    GEOCODE_PATH = "geocodes.csv"  # Géocodage local des adresses (adresse,latitude,longitude)
+    NOTICE_MS = 4000  # Durée d'affichage d'une notification dans la barre d'état
+    NOTICE_COLORS = {"info": "#4a7abc", "warning": "#b36b00", "error": "#c0392b"}
+
+    # update_medicines_display ne fait que soumettre le filtrage : on mesure la tâche et le redessin
+    PROFILED_CALLBACKS = ("save_delivery_info", "select_pharmacy", "_show_medicines",
+                          "add_medicine_to_cart", "update_cart_details", "remove_medicine_from_cart", "_repaint_cart")
+    PROFILED_JOBS = ("_filter_catalog",)  # Exécutées par BackgroundWorker
+
+    def __init__(self, root, catalog_path=None, journal_path="commandes.journal", profile=False, server=None,
+                 deltas_path="catalogue.deltas"):
         self.root = root
+        # Profilage optionnel : les callbacks sont enveloppés avant d'être passés aux widgets
+        self._profiler = Profiler(profile or os.environ.get("MYPHARM_PROFILE") == "1")
+        self._profiler.instrument(self, self.root, self.PROFILED_CALLBACKS)
+        self._profiler.instrument_jobs(self, self.PROFILED_JOBS)
+        self._profiler.watch_event_lag(self.root)
         self.root.title("Application de commande de médicaments")
         
         self.root.geometry("1100x600")
@@ -170,13 +3088,56 @@ class MyPharmApp:
         self.setup_styles()
 
         self._deliv_info = DeliveryInfo()
-        self._cart = Cart()
+        # Client léger d'un OrderServer (server = (hôte, port)) : les réservations sont faites par le
+        # serveur, sur le stock partagé par tous les postes ; sinon stock local (stocks.csv)
+        self._client = ServiceClient(*server) if server else None
+        # Source des numéros de commande pour les statistiques (le serveur a sa propre numérotation)
+        self._order_source = "server {}:{}".format(*server) if server else "journal"
+        if self._client is not None:
+            self._stock = RemoteStock(self._client, self._submit_stock_job)
+            self._stock_jobs = 0
+        else:
+            self._stock = StockLedger(timeout=self.CART_TIMEOUT_S)
+            load_stocks(self.STOCK_PATH, self._stock)
+        self._cart = Cart(self._stock)
         self._partner_set = PartnersSet()
-        self._cart_details = {}  # Dictionnaire qui stocke les détails du panier
+        self._service = OrderService(self._partner_set)
+        self._availability = AvailabilityIndex(self._partner_set)
+        self._optimizer = BasketOptimizer(self._availability)
+        self._geocodes = load_geocodes(self.GEOCODE_PATH)
+        self._geo_index = GeoIndex(self._partner_set, self._availability)
+        self._planner = AvailabilityPlanner(self._partner_set)
+        self._catalog_updater = CatalogUpdater(self._partner_set, (self._availability, self._planner, self._service))
+        self._deltas_path = deltas_path
+        self._deltas_offset = 0  # Octets du fichier de mises à jour déjà lus
 
-        self.fake_data()
+        # Journal des commandes passées : relu au démarrage, puis compacté régulièrement
+        self._journal = OrderJournal(journal_path)
+        self.compact_journal()
+        self._stats = None  # OrderLineStore, chargé en arrière-plan (None si NumPy est absent)
+        self._pending_stats = []  # Commandes passées avant la fin du chargement : (enregistrement, source)
 
         self.setup_ui()
+        self._worker = BackgroundWorker(self.root, on_busy=self._show_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if self._profiler.enabled:
+            # F12 : fenêtre de profilage
+            self.root.bind("<F12>", lambda event: self._profiler.show_overlay(self.root))
+
+        # Client léger : le réseau est lu depuis le serveur et les commandes y sont passées.
+        # Sinon catalogue SQLite s'il est fourni (chargé en arrière-plan), ou données de démonstration
+        if self._client is not None:
+            self._catalog_store = self._client
+            self._worker.submit("partners", self._catalog_store.load_pharmacies, on_done=self._on_partners_loaded)
+        elif catalog_path:
+            self._catalog_store = CatalogStore(catalog_path)
+            self._worker.submit("partners", self._catalog_store.load_pharmacies, on_done=self._on_partners_loaded)
+        else:
+            self.fake_data()
+        self.poll_catalog_deltas()
+        self.expire_carts()
+        self._worker.submit("stats", self._load_stats, on_done=self._on_stats_loaded,
+                            on_error=self._on_stats_failed)
 
     def setup_styles(self):
         """Configure les styles au niveau de l'interface utilisateur"""
@@ -200,35 +3161,183 @@ class MyPharmApp:
         self.style.configure("Cart.TLabel", background="#ACC4E7", foreground="#333333", padding=8, font=("Helvetica", 11, "bold"))
 
     def fake_data(self):
-        med1 = Medicine("Doliprane 500", "Antidouleur puissant base sur du paracétamol.", 8.5)
-        med2 = Medicine("Tamiflu", "Traitement contre la grippe.", 12.0)
-        med3 = Medicine("Euphon", "Sirop contre la toux", 7.5)
-        med4 = Medicine("Suppositoire.", "Facilite la digestion et le transit", 9.0)
-        med5 = Medicine("Xanax", "Anxiolytique, medicament contre le stress", 14.0)
-        med6 = Medicine("Pediakid", "Favorise l'endrmissement", 11.0)
-        med7 = Medicine("Rhinadvil", "Spray nasal lutte contre le nez encombré.", 6.5)
-        med8 = Medicine("Vitamine C", "Complément vitaminé pour réduire la fatigue.", 13.5)
-
-        pharm1 = Pharmacy("Pharmacie Bellevue", "13 Pl. Bellevue, Pharmacie centrale",
-                        open_days=[Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday],
-                        catalog=[med1, med2, med7])
-        
-        pharm2 = Pharmacy("Pharmacie de la beraudiere", "27 Rue de la Beraudière, Pharmacie située en périphérie",
-                        open_days=[Day.Wednesday, Day.Thursday, Day.Friday, Day.Saturday],
-                        catalog=[med3, med4, med8])
-        
-        pharm3 = Pharmacy("Pharmacie neyret fauriel", "67 Cr Fauriel, Petite pharmacie ouverte le week-end",
-                        open_days=[Day.Saturday, Day.Sunday],
-                        catalog=[med5, med6, med1])
-        
-        pharm4 = Pharmacy("Pharmacie carnot", "21 Rue Bergson, Pharmacie de garde ouverte tous les jours",
-                        open_days=[Day.Monday, Day.Tuesday, Day.Wednesday, Day.Thursday, Day.Friday, Day.Saturday, Day.Sunday],
-                        catalog=[med2, med3, med5, med6, med7])
-        
         # Ajoute les pharmacies au PartnersSet
-        self._partner_set._existing_partners.extend([pharm1, pharm2, pharm3, pharm4])
+        pharmacies = fake_pharmacies()
+        locate_pharmacies(pharmacies, self._geocodes)
+        self._partner_set.add_partners(pharmacies)
+
+    def _on_partners_loaded(self, pharmacies):
+        locate_pharmacies(pharmacies, self._geocodes)
+        self._partner_set.add_partners(pharmacies)
+        # Si le jour de livraison est déjà connu, la liste des pharmacies est mise à jour
+        current_day = self._deliv_info.get_day()
+        if current_day:
+            self._partner_set.update_available_by_day(current_day)
+            self.create_pharmacy_radio_buttons()
+
+    def _load_stats(self):
+        # Historique enregistré, complété par les commandes du journal qui n'y sont pas encore
+        stats = OrderLineStore.load(self.STATS_PATH)
+        stats.add_records(self._journal.get_records())
+        return stats
+
+    def _on_stats_loaded(self, stats):
+        # Commandes passées pendant le chargement (celles du journal déjà relues sont ignorées par seq)
+        for record, source in self._pending_stats:
+            stats.add_record(record, source)
+        self._stats = stats
+        if self._pending_stats:
+            self._worker.submit("stats_save", stats.save, self.STATS_PATH)
+        self._pending_stats = None
+        self.btn_stats.state(["!disabled"])
+
+    def _on_stats_failed(self, error):
+        # Sans NumPy, les statistiques sont désactivées
+        self._pending_stats = None
+
+    def record_stats(self, record, source="journal"):
+        """Ajoute une commande passée aux statistiques, enregistrées aussitôt en arrière-plan."""
+        if self._stats is None:
+            if self._pending_stats is not None:
+                self._pending_stats.append((record, source))
+            return
+        self._stats.add_record(record, source)
+        self._worker.submit("stats_save", self._stats.save, self.STATS_PATH)
+
+    def expire_carts(self):
+        """Vide le panier s'il est resté inactif trop longtemps (ses réservations ont été libérées)."""
+        for cart in self._stock.expire():
+            cart.clear()
+            if cart is self._cart:
+                self.schedule_cart_repaint()
+                self.notify("Panier inactif : les médicaments réservés ont été remis en stock.", "warning")
+        self.root.after(30 * 1000, self.expire_carts)
+
+    def poll_catalog_deltas(self):
+        """
+        Lit en arrière-plan les mises à jour ajoutées au fichier du fournisseur (une par ligne JSON)
+        depuis la dernière lecture, puis les applique.
+        """
+        self._worker.submit("deltas", self._read_deltas, self._deltas_offset, on_done=self._on_deltas_read)
+        self.root.after(self.DELTAS_POLL_MS, self.poll_catalog_deltas)
+
+    def _read_deltas(self, offset):
+        if not os.path.exists(self._deltas_path):
+            return offset, []
+        with open(self._deltas_path, "rb") as deltas_file:
+            deltas_file.seek(offset)
+            data = deltas_file.read()
+        # Une dernière ligne incomplète (en cours d'écriture) sera lue la prochaine fois
+        data = data[:data.rfind(b"\n") + 1]
+        deltas = []
+        for line in data.splitlines():
+            try:
+                deltas.append(json.loads(line))
+            except ValueError:
+                continue
+        return offset + len(data), deltas
+
+    def _on_deltas_read(self, result):
+        self._deltas_offset, deltas = result
+        self.apply_catalog_deltas(deltas)
+
+    def apply_catalog_deltas(self, deltas):
+        """
+        Applique des mises à jour du catalogue et ne rafraîchit que ce qu'elles touchent :
+        lignes du panier concernées, liste des pharmacies si l'une ouvre ou ferme le jour de livraison,
+        et médicaments affichés si la pharmacie active a changé.
+        """
+        day = self._deliv_info.get_day()
+        active_pharmacy = self._partner_set.get_active_partner()
+        shown = set(self.available_partners)
+        refresh_partners = reload_meds = refresh_meds = False
+        nb_applied = 0
+        for delta in deltas:
+            try:
+                result = self._catalog_updater.apply(delta)
+            except (ValueError, KeyError, TypeError) as error:
+                self.notify(f"Mise à jour du catalogue ignorée : {error}", "warning")
+                continue
+            if not result['applied']:
+                continue
+            nb_applied += 1
+            pharmacy = result['pharmacy']
+            pharm_name = pharmacy.get_name()
+            self._search_indexes.pop(pharmacy, None)
+            for med_name, med in result['repriced'].items():
+                if self._cart.reprice(med, pharm_name):
+                    self.schedule_cart_repaint(pharm_name, med_name)
+            for med_name in result['removed']:
+                info = self._cart.get_line(pharm_name, med_name)
+                if info is not None:
+                    self._cart.set_quantity(info['med'], 0, pharm_name)
+                    self.schedule_cart_repaint(pharm_name, med_name)
+            if result['open_days_changed'] and day is not None:
+                refresh_partners |= (pharmacy in shown) != self._partner_set.is_open(pharmacy, day)
+            if pharmacy is active_pharmacy:
+                reload_meds |= bool(result['added'] or result['removed'])
+                refresh_meds |= bool(result['repriced'])
+
+        if refresh_partners:
+            self.create_pharmacy_radio_buttons()
+        if reload_meds or (refresh_meds and (self.min_price_var.get() or self.max_price_var.get())):
+            # Les positions (ou le filtre de prix) ont changé : le catalogue affiché est refiltré tout de
+            # suite, avant tout redessin (un FilteredCatalog garde des positions de l'ancien catalogue).
+            # Un filtrage encore en cours sur l'ancien catalogue est annulé.
+            self._worker.cancel("catalog")
+            self._displayed_meds = self._filter_catalog(active_pharmacy, self.search_var.get(),
+                                                        self._parse_price(self.min_price_var),
+                                                        self._parse_price(self.max_price_var))
+            self._set_meds_first(self._meds_first)
+        elif refresh_meds:
+            # Seuls des prix ont changé : les lignes visibles sont simplement redessinées
+            self._refresh_med_rows()
+        if nb_applied:
+            self.notify(f"{nb_applied} mise{'s' if nb_applied > 1 else ''} à jour du catalogue appliquée{'s' if nb_applied > 1 else ''}.")
+
+    def _show_progress(self, nb_tasks):
+        """
+        Affiche la barre de progression tant que des tâches d'arrière-plan sont en cours.
+        """
+        if nb_tasks:
+            self.progress_label.config(text=f"Chargement… ({nb_tasks} tâche{'s' if nb_tasks > 1 else ''})")
+            self.progress_bar.start(10)
+        else:
+            self.progress_label.config(text="")
+            self.progress_bar.stop()
+
+    def compact_journal(self):
+        limit = (datetime.now() - timedelta(days=self.JOURNAL_RETENTION_DAYS)).isoformat(timespec="seconds")
+        self._journal.compact(lambda record: record.get('placed_at', "") >= limit)
+        self.root.after(self.JOURNAL_COMPACT_MS, self.compact_journal)
+
+    def on_close(self):
+        self._worker.shutdown()
+        self._journal.close()
+        if self._stats is not None:
+            self._stats.save(self.STATS_PATH)
+        if self._client is not None:
+            self._client.close()
+        if self._profiler.enabled:
+            self._profiler.dump("profil.json")
+        self.root.destroy()
 
     def setup_ui(self):
+        # Barre d'état en bas de la fenêtre : progression des chargements en arrière-plan
+        status_frame = ttk.Frame(self.root, padding=(10, 0, 10, 5))
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.progress_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=120)
+        self.progress_bar.pack(side=tk.RIGHT)
+        self.progress_label = ttk.Label(status_frame, text="", foreground="#666666")
+        self.progress_label.pack(side=tk.RIGHT, padx=5)
+        # Notifications non bloquantes (remplacent les boîtes de dialogue modales)
+        self.notice_label = ttk.Label(status_frame, text="")
+        self.notice_label.pack(side=tk.LEFT)
+        self._notice_after = None       # Effacement planifié de la notification
+        self._dirty_cart_keys = {}      # Lignes du panier à redessiner (dict ordonné)
+        self._cart_repaint_after = None # Redessin du panier planifié (after_idle)
+        self._cart_flash_after = None   # Fin de la mise en évidence du résumé du panier
+
         main_frame = ttk.Frame(self.root, padding=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
         
@@ -264,6 +3373,13 @@ class MyPharmApp:
         self.entry_prenom = ttk.Entry(prenom_frame, width=30)
         self.entry_prenom.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
 
+        # Champ pour rentrer l'adresse (facultative) : les pharmacies sont alors triées par distance
+        adresse_frame = ttk.Frame(frame_info)
+        adresse_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(adresse_frame, text="Adresse:", width=10).pack(side=tk.LEFT, padx=5, anchor="w")
+        self.entry_adresse = ttk.Entry(adresse_frame, width=30)
+        self.entry_adresse.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
         # Bouton de validation
         save_frame = ttk.Frame(frame_info)
         save_frame.pack(fill=tk.X, pady=10)
@@ -276,6 +3392,7 @@ class MyPharmApp:
         
         self.pharmacy_var = tk.IntVar(value=-1)        
         self.radio_buttons = []
+        self.available_partners = ()
         
         # Création d'un cadre avec un scrollbar pour faire defiller les pharmacies
         self.pharma_canvas = tk.Canvas(self.frame_pharma, bg="#f0f0f0", highlightthickness=0)
@@ -292,6 +3409,22 @@ class MyPharmApp:
         self.pharma_canvas.bind("<Enter>", lambda event: self._bind_to_mousewheel(self.pharma_canvas))
         self.pharma_canvas.bind("<Leave>", lambda event: self._unbind_from_mousewheel(self.pharma_canvas))
 
+        # - En bas a gauche : Qui propose un médicament ce jour-là (du moins cher au plus cher) -
+        frame_offers = ttk.LabelFrame(left_frame, text="Disponibilité d'un médicament", padding=10)
+        frame_offers.pack(fill=tk.X, pady=5)
+        offers_search = ttk.Frame(frame_offers)
+        offers_search.pack(fill=tk.X)
+        self.offer_var = tk.StringVar()
+        self.entry_offer = ttk.Combobox(offers_search, textvariable=self.offer_var, width=25,
+                                        postcommand=self._load_offer_names)
+        self.entry_offer.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.entry_offer.bind("<Return>", lambda event: self.show_cheapest_offers())
+        self.entry_offer.bind("<<ComboboxSelected>>", lambda event: self.show_cheapest_offers())
+        ttk.Button(offers_search, text="Chercher", command=self.show_cheapest_offers).pack(side=tk.LEFT, padx=5)
+        self.offers_list = tk.Listbox(frame_offers, height=4, bg="#ffffff", relief="flat")
+        self.offers_list.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(frame_offers, text="Répartir une liste de médicaments", command=self.open_basket_split).pack(pady=(0, 5))
+
         # -En haut a droite : Panier --
         frame_cart = ttk.LabelFrame(right_frame, text="Panier", padding=10)
         frame_cart.pack(fill=tk.X, pady=5)
@@ -310,47 +3443,72 @@ class MyPharmApp:
         # Creation d une zone qui affiche le détail du panier
         self.cart_details_frame = ttk.Frame(frame_cart, padding=5)
         self.cart_details_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        self._cart_view = CartView(self.cart_details_frame, self.remove_medicine_from_cart)
         
         # Bouton "Passer commande"
         self.btn_order = ttk.Button(frame_cart, text="Passer commande", command=self.passer_commande)
         self.btn_order.pack(pady=10)
+        # Bouton "Statistiques" (activé une fois l'historique chargé)
+        self.btn_stats = ttk.Button(frame_cart, text="Statistiques des commandes", command=self.open_stats_report,
+                                    state="disabled")
+        self.btn_stats.pack(pady=(0, 10))
 
         # - En bas à droite : Médicaments disponibles -
         frame_meds = ttk.LabelFrame(right_frame, text="Médicaments disponibles", padding=10)
         frame_meds.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        # Création d'un cadre avec scrollbar qui permet de faire defiler les médicaments
+        # Recherche (nom ou description) et fourchette de prix au-dessus de la liste
+        search_frame = ttk.Frame(frame_meds)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Recherche:").pack(side=tk.LEFT, padx=5)
+        self.search_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.search_var, width=20).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Label(search_frame, text="Prix:").pack(side=tk.LEFT, padx=5)
+        self.min_price_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.min_price_var, width=6).pack(side=tk.LEFT)
+        ttk.Label(search_frame, text="à").pack(side=tk.LEFT)
+        self.max_price_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.max_price_var, width=6).pack(side=tk.LEFT)
+        ttk.Label(search_frame, text="€").pack(side=tk.LEFT)
+        self._search_indexes = {}   # Pharmacy -> MedicineIndex (construit à la première recherche)
+        self._search_after = None   # Recherche planifiée (anti-rebond de la saisie)
+        for var in (self.search_var, self.min_price_var, self.max_price_var):
+            var.trace_add("write", lambda *args: self._schedule_search())
+
+        # Liste virtualisée des médicaments : un nombre fixe de lignes (adapté à la hauteur
+        # visible de meds_canvas) est réutilisé pendant le défilement, seules les données changent
         self.meds_canvas = tk.Canvas(frame_meds, bg="#f0f0f0", highlightthickness=0)
-        self.meds_scrollbar = ttk.Scrollbar(frame_meds, orient=tk.VERTICAL, command=self.meds_canvas.yview)
-        self.meds_canvas.configure(yscrollcommand=self.meds_scrollbar.set)
+        self.meds_scrollbar = ttk.Scrollbar(frame_meds, orient=tk.VERTICAL, command=self._meds_yview)
         
         self.meds_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.meds_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        self.med_list_frame = ttk.Frame(self.meds_canvas)
-        self.meds_canvas.create_window((0, 0), window=self.med_list_frame, anchor="nw")
-        self.med_list_frame.bind("<Configure>", lambda e: self.meds_canvas.configure(scrollregion=self.meds_canvas.bbox("all")))
+        self._med_rows = []          # Pool de lignes réutilisées
+        self._displayed_meds = []    # Catalogue actuellement affiché
+        self._meds_first = 0         # Index du premier médicament visible
+        self.meds_canvas.bind("<Configure>", self._resize_med_rows)
         # Fonction qui permet le defilement des médicaments grace a la molette
-        self.meds_canvas.bind("<Enter>", lambda event: self._bind_to_mousewheel(self.meds_canvas))
+        self.meds_canvas.bind("<Enter>", lambda event: self._bind_to_mousewheel(self.meds_canvas, self._scroll_meds))
         self.meds_canvas.bind("<Leave>", lambda event: self._unbind_from_mousewheel(self.meds_canvas))
 
     # Bout de code qui permet d'utiliser la molette de la souris dans les canvas tkinter
-    def _bind_to_mousewheel(self, canvas):
-        canvas.bind_all("<MouseWheel>", lambda event: self._on_mousewheel(event, canvas))
+    def _bind_to_mousewheel(self, canvas, scroll=None):
+        scroll = scroll if scroll else canvas.yview_scroll
+        canvas.bind_all("<MouseWheel>", lambda event: self._on_mousewheel(event, scroll))
 
     def _unbind_from_mousewheel(self, canvas):
         canvas.unbind_all("<MouseWheel>")
 
-    def _on_mousewheel(self, event, canvas):
+    def _on_mousewheel(self, event, scroll):
         # Gestion sur Windows et autres plateformes
         if event.delta:
-            canvas.yview_scroll(-int(event.delta/120), "units")
+            scroll(-int(event.delta/120), "units")
         else:
             # Pour les systèmes qui n'utilisent pas event.delta (ex: Linux)
             if event.num == 4:
-                canvas.yview_scroll(-1, "units")
+                scroll(-1, "units")
             elif event.num == 5:
-                canvas.yview_scroll(1, "units")
+                scroll(1, "units")
 
     def create_pharmacy_radio_buttons(self):
         # Supprime les anciens boutons s'il y en a
@@ -361,14 +3519,24 @@ class MyPharmApp:
         # Récupère la liste des pharmacies disponibles
         self.available_partners = self._partner_set.get_available_partners()
 
+        # Avec une adresse de livraison connue, les pharmacies sont affichées de la plus proche
+        # à la plus éloignée (la valeur du bouton reste l'indice parmi les partenaires disponibles)
+        entries = [(index, pharm, None) for index, pharm in enumerate(self.available_partners)]
+        origin = self._delivery_location()
+        if origin is not None:
+            distances = {pharm: distance for distance, pharm in
+                         self._geo_index.nearest(origin, len(entries), self._deliv_info.get_day())}
+            entries = [(index, pharm, distances.get(pharm)) for index, pharm, _ in entries]
+            entries.sort(key=lambda entry: math.inf if entry[2] is None else entry[2])
+
         # Crée un bouton radio pour chaque pharmacie disponible
-        for index, pharm in enumerate(self.available_partners):
+        for position, (index, pharm, distance) in enumerate(entries):
             pharm_frame = ttk.Frame(self.pharma_list_frame, padding=5)
             pharm_frame.pack(fill=tk.X, pady=2)
             
             rb = ttk.Radiobutton(
                 pharm_frame,
-                text=pharm.get_name(),
+                text=pharm.get_name() if distance is None else f"{pharm.get_name()} ({distance:.1f} km)",
                 variable=self.pharmacy_var,
                 value=index,
                 command=self.select_pharmacy
@@ -384,10 +3552,27 @@ class MyPharmApp:
             desc_label.pack(fill=tk.X, padx=25, pady=(0, 5))
             
             # Ajoute un séparateur sauf pour le dernier élément
-            if index < len(self.available_partners) - 1:
+            if position < len(entries) - 1:
                 separator = ttk.Separator(self.pharma_list_frame, orient='horizontal')
                 separator.pack(fill=tk.X, padx=5, pady=5)
 
+    def _delivery_location(self):
+        """
+        Position de l'adresse saisie : géocodée avec le fichier local, ou saisie directement
+        sous la forme "latitude, longitude". None si elle est vide ou inconnue.
+        """
+        address = self.entry_adresse.get().strip()
+        if not address:
+            return None
+        location = self._geocodes.get(address.casefold())
+        if location is None:
+            latitude, _, longitude = address.partition(",")
+            try:
+                location = (float(latitude), float(longitude))
+            except ValueError:
+                self.notify(f"Adresse inconnue : {address}", "warning")
+        return location
+
     def save_delivery_info(self):
         """
         Récupère les informations saisies et les sauvegarde dans l'objet DeliveryInfo
@@ -398,149 +3583,452 @@ class MyPharmApp:
         date_str = self.date_label.cget("text")
         
         # Vérif des champs
-        if not nom or not prenom:
-            messagebox.showwarning("Informations incomplètes", "Veuillez remplir tous les champs.")
+        try:
+            current_day = self._service.save_delivery_info(self._deliv_info, nom, prenom, date_str)
+        except ValueError as error:
+            self.notify(str(error), "warning")
             return
-            
-        self._deliv_info.set_date(date_str)
-        self._deliv_info.set_name(nom)
-        self._deliv_info.set_first_name(prenom)
-        messagebox.showinfo("Informations enregistrées", f"Infos enregistrées : {self._deliv_info}")
+        self.notify(f"Infos enregistrées : {self._deliv_info}")
 
         # Mise à jour des pharmacies disponibles selon le jour de livraison
-        current_day = self._deliv_info.get_day()
         if current_day:
-            self._partner_set.update_available_by_day(current_day)
             self.create_pharmacy_radio_buttons()
         else:
-            messagebox.showerror("Erreur", "Date invalide, impossible de déterminer le jour.")
+            self.notify("Date invalide, impossible de déterminer le jour.", "error")
+
+    def _load_offer_names(self):
+        # La liste des noms (et l'index sous-jacent) est construite en arrière-plan
+        self._worker.submit("offer_names", lambda: sorted(self._availability.medicine_names()),
+                            on_done=lambda names: self.entry_offer.configure(values=names))
+
+    def show_cheapest_offers(self):
+        """
+        Affiche les partenaires ouverts le jour de livraison (ou aujourd'hui) qui proposent
+        le médicament saisi, du moins cher au plus cher.
+        """
+        day = self._deliv_info.get_day() or self._deliv_info.compute_day(self.date_label.cget("text"))
+        self._worker.submit("offers", self._availability.cheapest_offers, self.offer_var.get(), day,
+                            on_done=lambda offers: self._show_offers(offers, day))
+
+    def _show_offers(self, offers, day):
+        self.offers_list.delete(0, tk.END)
+        for pharmacy, med in offers:
+            self.offers_list.insert(tk.END, f"{med.get_price():.2f} € - {pharmacy.get_name()}")
+        if not offers:
+            self.offers_list.insert(tk.END, f"Aucun partenaire ouvert ({day.name}) ne propose ce médicament.")
 
     def select_pharmacy(self):
         """
         Lorsqu'une pharmacie est sélectionnée, on enregistre la pharmacie active
         et on met à jour l'affichage des médicaments disponibles.
         """
-        index = self.pharmacy_var.get()
-        if 0 <= index < len(self.available_partners):
-            selected_pharmacy = self.available_partners[index]
-            self._partner_set.set_active_partner(selected_pharmacy)
+        selected_pharmacy = self._service.select_partner(self.pharmacy_var.get())
+        if selected_pharmacy is not None:
             self.update_medicines_display(selected_pharmacy)
 
     def update_medicines_display(self, pharmacy):
         """
         Affiche la liste des médicaments disponibles de la pharmacie sélectionnée 
         et fait en sorte que pour chaque médicament, un bouton 'Ajouter' permette de l'ajouter au panier.
+        Aucun widget n'est créé ici : les lignes existantes sont simplement reliées au nouveau catalogue.
+        Le catalogue est chargé et filtré en arrière-plan ; un chargement encore en cours pour
+        une autre pharmacie (ou une recherche précédente) est annulé.
         """
-        # Efface l'ancienne liste
-        for widget in self.med_list_frame.winfo_children():
-            widget.destroy()
+        self._worker.submit("catalog", self._filter_catalog, pharmacy, self.search_var.get(),
+                            self._parse_price(self.min_price_var), self._parse_price(self.max_price_var),
+                            on_done=self._show_medicines)
 
-        # Crée l'affichage pour chaque médicament
-        for i, med in enumerate(pharmacy.get_catalog()):
-            med_frame = ttk.Frame(self.med_list_frame, padding=5)
-            med_frame.pack(fill=tk.X, pady=5)
-            
-            med_icon = ttk.Label(med_frame, text="💊", font=("Helvetica", 12))
-            med_icon.pack(side=tk.LEFT, padx=5)
-            
-            info_frame = ttk.Frame(med_frame)
-            info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-            
-            name_label = ttk.Label(info_frame, text=med.get_name(), font=("Helvetica", 10, "bold"))
-            name_label.pack(anchor="w")
-            
-            desc_label = ttk.Label(info_frame, text=med.get_description(), wraplength=300)
-            desc_label.pack(anchor="w")
-            
-            price_label = ttk.Label(info_frame, text=f"{med.get_price()} €", foreground="#2c5282", font=("Helvetica", 10, "bold"))
-            price_label.pack(anchor="w")
-            
-            btn_frame = ttk.Frame(med_frame)
-            btn_frame.pack(side=tk.RIGHT, padx=5)
-            
-            btn_add = ttk.Button(btn_frame, text="Ajouter au panier", command=lambda m=med: self.add_medicine_to_cart(m))
-            btn_add.pack()
-            
-            # Ajout d'un séparateur entre les médicaments
-            if i < len(pharmacy.get_catalog()) - 1:
-                separator = ttk.Separator(self.med_list_frame, orient='horizontal')
-                separator.pack(fill=tk.X, padx=5, pady=5)
+    def _show_medicines(self, meds):
+        self._displayed_meds = meds
+        self._meds_first = 0
+        self._refresh_med_rows()
 
-    def add_medicine_to_cart(self, med):
+    def _schedule_search(self):
         """
-        Ajoute le médicament sélectionné au panier et met à jour l'affichage du panier
+        Anti-rebond : la recherche n'est lancée que 150 ms après la dernière frappe.
         """
-        self._cart.add_to_cart(med)
-        total_price = self._cart.get_total_price()
-        nb_med = self._cart.get_nb_med()
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+        self._search_after = self.root.after(150, self._apply_search)
+
+    def _apply_search(self):
+        self._search_after = None
+        active_pharmacy = self._partner_set.get_active_partner()
+        if active_pharmacy is not None:
+            self.update_medicines_display(active_pharmacy)
+
+    def _parse_price(self, var):
+        try:
+            return float(var.get().replace(",", "."))
+        except ValueError:
+            return None
+
+    def _filter_catalog(self, pharmacy, query, min_price, max_price):
+        """
+        Retourne le catalogue de la pharmacie, restreint par la recherche et la fourchette de prix.
+        Exécutée dans un thread de BackgroundWorker : ne touche à aucun widget.
+        """
+        catalog = pharmacy.get_catalog()
+        if not query.strip() and min_price is None and max_price is None:
+            return catalog
+        index = self._search_indexes.get(pharmacy)
+        if index is None or len(index) != len(catalog):
+            index = self._search_indexes[pharmacy] = MedicineIndex(catalog)
+        return FilteredCatalog(catalog, index.search(query, min_price, max_price))
+
+    def _create_med_row(self, slot):
+        """
+        Crée une ligne (vide) de la liste des médicaments, placée à l'emplacement slot du canvas.
+        """
+        med_frame = ttk.Frame(self.meds_canvas, padding=5)
         
-        cart_text = f"{nb_med} médicament{'s' if nb_med > 1 else ''} - Total: {total_price:.2f} €"
-        self.cart_info.config(text=cart_text)
+        med_icon = ttk.Label(med_frame, text="💊", font=("Helvetica", 12))
+        med_icon.pack(side=tk.LEFT, padx=5)
         
-        self.cart_info.configure(foreground="#4a7abc")
-        self.root.after(300, lambda: self.cart_info.configure(foreground="#333333"))
+        info_frame = ttk.Frame(med_frame)
+        info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         
-        # Met à jour le dictionnaire sur les détails du panier
-        active_pharmacy = self._partner_set.get_active_partner()
-        pharm_name = active_pharmacy.get_name() if active_pharmacy else "Inconnu"
-        if pharm_name not in self._cart_details:
-            self._cart_details[pharm_name] = {}
-        if med.get_name() not in self._cart_details[pharm_name]:
-            self._cart_details[pharm_name][med.get_name()] = {'med': med, 'quantity': 0}
-        self._cart_details[pharm_name][med.get_name()]['quantity'] += 1
+        name_label = ttk.Label(info_frame, font=("Helvetica", 10, "bold"))
+        name_label.pack(anchor="w")
+        
+        desc_label = ttk.Label(info_frame, wraplength=300)
+        desc_label.pack(anchor="w")
+        
+        price_label = ttk.Label(info_frame, foreground="#2c5282", font=("Helvetica", 10, "bold"))
+        price_label.pack(anchor="w")
+        
+        btn_frame = ttk.Frame(med_frame)
+        btn_frame.pack(side=tk.RIGHT, padx=5)
+        
+        btn_add = ttk.Button(btn_frame, text="Ajouter au panier")
+        btn_add.pack()
         
-        # Met à jour l'affichage détaillé du panier
-        self.update_cart_details()
+        # Séparateur en bas de la ligne (masqué pour le dernier médicament)
+        separator = ttk.Separator(med_frame, orient='horizontal')
         
-        messagebox.showinfo("Panier mis à jour", f"'{med.get_name()}' ajouté au panier.")
+        window = self.meds_canvas.create_window((0, slot * self.MED_ROW_HEIGHT), window=med_frame, anchor="nw",
+                                                height=self.MED_ROW_HEIGHT, width=self.meds_canvas.winfo_width())
+        return {'frame': med_frame, 'window': window, 'icon': med_icon, 'name': name_label,
+                'desc': desc_label, 'price': price_label, 'button': btn_add, 'separator': separator}
+
+    def _bind_med_row(self, row, med, is_last):
+        """
+        Relie une ligne existante aux données d'un médicament.
+        """
+        row['name'].config(text=med.get_name())
+        row['desc'].config(text=med.get_description())
+        row['price'].config(text=f"{med.get_price()} €")
+        row['button'].config(command=lambda m=med: self.add_medicine_to_cart(m))
+        if is_last:
+            row['separator'].pack_forget()
+        elif not row['separator'].winfo_manager():
+            row['separator'].pack(side=tk.BOTTOM, fill=tk.X, padx=5, before=row['icon'])
+        self.meds_canvas.itemconfigure(row['window'], state="normal")
+
+    def _resize_med_rows(self, event):
+        """
+        Adapte la taille du pool de lignes à la hauteur visible de meds_canvas.
+        """
+        needed = event.height // self.MED_ROW_HEIGHT + 1
+        while len(self._med_rows) < needed:
+            self._med_rows.append(self._create_med_row(len(self._med_rows)))
+        while len(self._med_rows) > needed:
+            row = self._med_rows.pop()
+            self.meds_canvas.delete(row['window'])
+            row['frame'].destroy()
+        for row in self._med_rows:
+            self.meds_canvas.itemconfigure(row['window'], width=event.width)
+        self._set_meds_first(self._meds_first)
+
+    def _set_meds_first(self, first):
+        visible = max(1, self.meds_canvas.winfo_height() // self.MED_ROW_HEIGHT)
+        max_first = max(0, len(self._displayed_meds) - visible)
+        self._meds_first = min(max(0, first), max_first)
+        self._refresh_med_rows()
+
+    def _refresh_med_rows(self):
+        """
+        Relie chaque ligne du pool au médicament correspondant à la position de défilement.
+        """
+        total = len(self._displayed_meds)
+        for slot, row in enumerate(self._med_rows):
+            index = self._meds_first + slot
+            if index < total:
+                self._bind_med_row(row, self._displayed_meds[index], index == total - 1)
+            else:
+                self.meds_canvas.itemconfigure(row['window'], state="hidden")
+        if total:
+            self.meds_scrollbar.set(self._meds_first / total, min(1.0, (self._meds_first + len(self._med_rows)) / total))
+        else:
+            self.meds_scrollbar.set(0.0, 1.0)
+
+    def _scroll_meds(self, amount, what="units"):
+        step = int(amount) if what == "units" else int(amount) * max(1, len(self._med_rows) - 1)
+        self._set_meds_first(self._meds_first + step)
+
+    def _meds_yview(self, *args):
+        """
+        Commande de la scrollbar des médicaments ('moveto' ou 'scroll').
+        """
+        if args[0] == "moveto":
+            self._set_meds_first(round(float(args[1]) * len(self._displayed_meds)))
+        elif args[0] == "scroll":
+            self._scroll_meds(args[1], args[2])
+
+    def _submit_stock_job(self, func, *args, **params):
+        """Lance un appel de RemoteStock en tâche de fond (une clé par appel : aucun n'en remplace un autre)."""
+        self._stock_jobs += 1
+        self._worker.submit(("stock", self._stock_jobs), partial(func, *args, **params))
 
-    def update_cart_details(self):
+    def reserve_then(self, items, callback):
+        """
+        Client léger : réserve les lignes (pharmacie, médicament, quantité) sur le serveur en tâche
+        de fond, puis appelle callback(refus) dans le thread Tk. Sinon callback([]) directement
+        (le StockLedger local réserve au moment de l'ajout au panier).
+        """
+        if self._client is None:
+            callback([])
+            return
+        self._stock_jobs += 1
+        self._worker.submit(("stock", self._stock_jobs), self._stock.request, self._cart, items, on_done=callback,
+                            on_error=lambda error: self.notify(f"Réservation impossible : {error}", "error"))
+
+    def add_medicine_to_cart(self, med):
+        """
+        Ajoute le médicament sélectionné au panier et met à jour l'affichage du panier
+        """
+        active_pharmacy = self._partner_set.get_active_partner()
+        pharm_name = active_pharmacy.get_name() if active_pharmacy else "Inconnu"
+
+        def add(refused):
+            if refused:
+                self.notify(refused[0][1], "warning")
+                return
+            try:
+                self._cart.add_to_cart(med, pharm_name)
+            except ValueError as error:
+                self.notify(str(error), "warning")
+                return
+            # Le redessin est regroupé : une rafale d'ajouts ne provoque qu'un seul rafraîchissement
+            self.schedule_cart_repaint(pharm_name, med.get_name())
+            self.notify(f"'{med.get_name()}' ajouté au panier.")
+
+        self.reserve_then([(pharm_name, med.get_name(), 1)], add)
+
+    def notify(self, message, level="info"):
+        """
+        Affiche une notification dans la barre d'état, sans bloquer l'utilisateur.
+        Elle disparaît après NOTICE_MS ; une nouvelle notification remplace la précédente.
+        """
+        self.notice_label.config(text=message, foreground=self.NOTICE_COLORS[level])
+        if self._notice_after is not None:
+            self.root.after_cancel(self._notice_after)
+        self._notice_after = self.root.after(self.NOTICE_MS, self._clear_notice)
+
+    def _clear_notice(self):
+        self._notice_after = None
+        self.notice_label.config(text="")
+
+    def schedule_cart_repaint(self, pharm=None, med_name=None):
+        """
+        Marque une ligne du panier (ou tout le panier si pharm vaut None) à redessiner.
+        Les demandes sont fusionnées et traitées en une fois quand Tk est inactif.
+        """
+        self._dirty_cart_keys[(pharm, med_name)] = None
+        if self._cart_repaint_after is None:
+            self._cart_repaint_after = self.root.after_idle(self._repaint_cart)
+
+    def _repaint_cart(self):
+        self._cart_repaint_after = None
+        keys, self._dirty_cart_keys = self._dirty_cart_keys, {}
+        if (None, None) in keys:
+            self.update_cart_details()
+        else:
+            for pharm, med_name in keys:
+                self.update_cart_details(pharm, med_name)
+        self.update_cart_info()
+
+        # Mise en évidence du résumé, prolongée (et non replanifiée) pendant une rafale
+        self.cart_info.configure(foreground="#4a7abc")
+        if self._cart_flash_after is not None:
+            self.root.after_cancel(self._cart_flash_after)
+        self._cart_flash_after = self.root.after(300, self._end_cart_flash)
+
+    def _end_cart_flash(self):
+        self._cart_flash_after = None
+        self.cart_info.configure(foreground="#333333")
+
+    def update_cart_details(self, pharm=None, med_name=None):
         """
         Met à jour l'affichage détaillé du panier avec une liste à points des médicaments,
         leur quantité, le prix de chauqe médicament et le total par médicament, groupés par pharmacie.
+        Si une ligne (pharm, med_name) est indiquée, seule cette ligne est mise à jour ;
+        sinon, l'affichage complet est resynchronisé avec le panier.
         """
-        # Efface le contenu précédent
-        for widget in self.cart_details_frame.winfo_children():
-            widget.destroy()
-        
-        # Affiche les détails du panier
-        for i, (pharm, meds) in enumerate(self._cart_details.items()):
-            pharm_label = ttk.Label(self.cart_details_frame, text=pharm, font=("Helvetica", 8, "italic"), foreground="#555555")
-            pharm_label.pack(anchor="w", pady=(5, 0))
-            for med_name, info in meds.items():
-                line_frame = ttk.Frame(self.cart_details_frame)
-                line_frame.pack(fill="x", padx=10, pady=2)
-                quantity = info['quantity']
-                unit_price = info['med'].get_price()
-                total_price = quantity * unit_price
-                med_text = f"• {med_name} x{quantity} - {unit_price:.2f} € chacun, total {total_price:.2f} €"
-                med_label = ttk.Label(line_frame, text=med_text, font=("Helvetica", 10))
-                med_label.pack(side=tk.LEFT, anchor="w")
-                # Bouton de retrait d'un exemplaire
-                remove_button = ttk.Button(line_frame, text="❌", width=3, command=lambda p=pharm, m=med_name: self.remove_medicine_from_cart(p, m))
-                remove_button.pack(side=tk.RIGHT)
-            # Séparateur entre pharmacies
-            if i < len(self._cart_details) - 1:
-                sep = ttk.Separator(self.cart_details_frame, orient='horizontal')
-                sep.pack(fill=tk.X, pady=5)
+        if pharm is not None:
+            keys = [(pharm, med_name)]
+        else:
+            keys = self._cart_view.get_keys()
+            keys += [(p, m) for p, meds in self._cart.get_lines().items() for m in meds]
+        for pharm, med_name in dict.fromkeys(keys):
+            info = self._cart.get_line(pharm, med_name)
+            if info is None:
+                self._cart_view.remove_line(pharm, med_name)
+            else:
+                self._cart_view.set_line(pharm, med_name, info['quantity'], info['med'].get_price())
 
     def remove_medicine_from_cart(self, pharm, med_name):
         """
         Retire un exemplaire du médicament indiqué du panier.
         """
-        info = self._cart_details.get(pharm, {}).get(med_name, None)
-        if info is not None and info['quantity'] > 0:
-            info['quantity'] -= 1
-            self._cart.remove_from_cart(info['med'])
-            if info['quantity'] <= 0:
-                del self._cart_details[pharm][med_name]
-            if not self._cart_details[pharm]:
-                del self._cart_details[pharm]
-            self.update_cart_details()
-            total_price = self._cart.get_total_price()
-            nb_med = self._cart.get_nb_med()
-            cart_text = f"{nb_med} médicament{'s' if nb_med > 1 else ''} - Total: {total_price:.2f} €"
-            self.cart_info.config(text=cart_text)
+        if self._service.remove_from_cart(self._cart, pharm, med_name):
+            self.schedule_cart_repaint(pharm, med_name)
+
+    def update_cart_info(self):
+        """
+        Met à jour le résumé du panier (nombre de médicaments et total).
+        """
+        total_price = self._cart.get_total_price()
+        nb_med = self._cart.get_nb_med()
+        cart_text = f"{nb_med} médicament{'s' if nb_med > 1 else ''} - Total: {total_price:.2f} €"
+        self.cart_info.config(text=cart_text)
+
+    def open_basket_split(self):
+        """
+        Fenêtre de saisie d'une liste de médicaments (une ligne « nom x quantité » par médicament),
+        répartie automatiquement entre les partenaires ouverts puis ajoutée au panier.
+        """
+        split_window = tk.Toplevel(self.root)
+        split_window.title("Répartir une liste de médicaments")
+        split_window.geometry("420x400")
+        
+        ttk.Label(split_window, text="Un médicament par ligne, ex: Doliprane 500 x2").pack(anchor="w", padx=10, pady=(10, 0))
+        list_text = tk.Text(split_window, height=10, font=("Helvetica", 10))
+        list_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        objective_var = tk.StringVar(value="price")
+        objective_frame = ttk.Frame(split_window)
+        objective_frame.pack(fill=tk.X, padx=10)
+        ttk.Radiobutton(objective_frame, text="Prix le plus bas", variable=objective_var, value="price").pack(side=tk.LEFT)
+        ttk.Radiobutton(objective_frame, text="Moins de pharmacies", variable=objective_var, value="pharmacies").pack(side=tk.LEFT)
+        
+        result_label = ttk.Label(split_window, text="", wraplength=380)
+        result_label.pack(fill=tk.X, padx=10)
+        
+        def read_list():
+            wanted = []
+            for line in list_text.get("1.0", tk.END).splitlines():
+                name, _, quantity = line.strip().rpartition(" x")
+                if name and quantity.isdigit():
+                    wanted.append((name, int(quantity)))
+                elif line.strip():
+                    wanted.append((line.strip(), 1))
+            return wanted
+        
+        def split():
+            wanted = read_list()
+            day = self._deliv_info.get_day() or self._deliv_info.compute_day(self.date_label.cget("text"))
+            result_label.config(text="Répartition en cours…")
+            self._worker.submit("basket_split", self._optimizer.optimize, wanted, day, objective_var.get(),
+                                on_done=lambda result: show_result(result, day))
+        
+        def show_result(result, day):
+            items = [(pharmacy.get_name(), med.get_name(), quantity) for pharmacy, med, quantity in result['assignment']]
+            self.reserve_then(items, lambda refused: fill_cart(result, day))
+
+        def fill_cart(result, day):
+            # Les lignes refusées par le serveur (client léger) le sont aussi ici : pas de réservation confirmée
+            refused = BasketOptimizer.apply_to_cart(self._cart, result)
+            self.schedule_cart_repaint()
+            if refused:
+                self.notify(f"Stock insuffisant : {', '.join(refused)}", "warning")
+            if not split_window.winfo_exists():
+                return
+            text = f"{len(result['assignment'])} médicament(s) répartis sur {result['nb_pharmacies']} pharmacie(s), total {result['total_cents'] / 100:.2f} €"
+            if result['missing']:
+                text += f"\nIndisponibles ({day.name}) : {', '.join(result['missing'])}"
+            result_label.config(text=text)
+        
+        def plan():
+            # Première date (sur 4 semaines) où toute la liste peut être servie par les partenaires ouverts
+            names = [name for name, _ in read_list()]
+            start = self._deliv_info.get_date() or self.date_label.cget("text")
+            start = datetime.strptime(start, "%d/%m/%Y").date()
+            result_label.config(text="Recherche d'une date…")
+            self._worker.submit("basket_plan", self._planner.first_full_date, names, start,
+                                on_done=show_plan,
+                                on_error=lambda error: result_label.config(text=str(error)) if split_window.winfo_exists() else None)
+        
+        def show_plan(first_date):
+            if not split_window.winfo_exists():
+                return
+            if first_date is None:
+                result_label.config(text="Aucune date dans les 4 prochaines semaines ne permet de tout servir.")
+            else:
+                result_label.config(text=f"Liste entièrement disponible à partir du {first_date:%d/%m/%Y} "
+                                         f"({Day(first_date.weekday()).name}).")
+        
+        buttons = ttk.Frame(split_window)
+        buttons.pack(pady=10)
+        ttk.Button(buttons, text="Ajouter au panier", command=split).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Première date possible", command=plan).pack(side=tk.LEFT, padx=5)
+
+    def open_stats_report(self):
+        """
+        Fenêtre de statistiques sur l'historique des commandes : chiffre d'affaires par pharmacie
+        et jour de livraison, médicaments les plus vendus et taille des paniers.
+        Les calculs sont faits en arrière-plan.
+        """
+        report_window = tk.Toplevel(self.root)
+        report_window.title("Statistiques des commandes")
+        report_window.geometry("760x520")
+        summary_label = ttk.Label(report_window, text="Calcul en cours…")
+        summary_label.pack(anchor="w", padx=10, pady=(10, 0))
+        
+        notebook = ttk.Notebook(report_window)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        day_names = [day.name for day in Day]
+        revenue_tree = ttk.Treeview(notebook, columns=["pharmacy"] + day_names + ["total"], show="headings")
+        revenue_tree.heading("pharmacy", text="Pharmacie")
+        revenue_tree.column("pharmacy", width=180)
+        for column in day_names + ["total"]:
+            revenue_tree.heading(column, text=column[:3] if column != "total" else "Total")
+            revenue_tree.column(column, width=70, anchor="e")
+        top_tree = ttk.Treeview(notebook, columns=("medicine", "quantity", "revenue"), show="headings")
+        for column, text in (("medicine", "Médicament"), ("quantity", "Exemplaires"), ("revenue", "Chiffre d'affaires")):
+            top_tree.heading(column, text=text)
+        sizes_tree = ttk.Treeview(notebook, columns=("size", "orders", "share"), show="headings")
+        for column, text in (("size", "Exemplaires par commande"), ("orders", "Commandes"), ("share", "Part")):
+            sizes_tree.heading(column, text=text)
+        notebook.add(revenue_tree, text="CA par pharmacie et jour")
+        notebook.add(top_tree, text="Meilleures ventes")
+        notebook.add(sizes_tree, text="Taille des paniers")
+        
+        def compute(stats):
+            revenue = stats.revenue_by_pharmacy_day()
+            order = revenue.sum(axis=1).argsort()[::-1][:200]  # Les 200 pharmacies au plus fort CA
+            names = stats.get_pharmacy_names()
+            revenue_rows = [(names[i], revenue[i].tolist()) for i in order]
+            quantities = dict(stats.top_medicines(50, "quantity"))
+            revenues = dict(stats.top_medicines(len(stats.get_medicine_names()), "revenue"))
+            top_rows = [(name, quantity, revenues.get(name, 0)) for name, quantity in quantities.items()]
+            return len(stats), stats.get_nb_orders(), revenue.sum(), revenue_rows, top_rows, stats.basket_sizes().tolist()
+        
+        def show(result):
+            if not report_window.winfo_exists():
+                return
+            nb_lines, nb_orders, total, revenue_rows, top_rows, sizes = result
+            summary_label.config(text=f"{nb_orders} commandes, {nb_lines} lignes, chiffre d'affaires {total / 100:,.2f} €")
+            for name, cells in revenue_rows:
+                values = [f"{cents / 100:,.2f}" for cents in cells + [sum(cells)]]
+                revenue_tree.insert("", tk.END, values=[name] + values)
+            for name, quantity, cents in top_rows:
+                top_tree.insert("", tk.END, values=(name, quantity, f"{cents / 100:,.2f} €"))
+            for size, count in enumerate(sizes):
+                if count:
+                    sizes_tree.insert("", tk.END, values=(size, count, f"{count / max(1, nb_orders):.1%}"))
+        
+        self._worker.submit("stats_report", compute, self._stats, on_done=show)
 
     def passer_commande(self):
         """
@@ -550,24 +4038,43 @@ class MyPharmApp:
         order_window.title("Ticket de commande")
         order_window.geometry("400x500")
         
-        ticket_lines = []
-        ticket_lines.append("=== Ticket de commande ===")
-        ticket_lines.append("")
-        ticket_lines.append("Informations patient:")
-        ticket_lines.append(f"Nom: {self._deliv_info.get_name()}")
-        ticket_lines.append(f"Prénom: {self._deliv_info.get_first_name()}")
-        ticket_lines.append(f"Date: {self._deliv_info.get_date()} ({self._deliv_info.get_day().name if self._deliv_info.get_day() else 'Inconnu'})")
-        ticket_lines.append("")
-        ticket_lines.append("Détails du panier:")
-        for pharm, meds in self._cart_details.items():
-            ticket_lines.append(f"Pharmacie: {pharm}")
-            for med_name, info in meds.items():
-                quantity = info['quantity']
-                unit_price = info['med'].get_price()
-                total_price = quantity * unit_price
-                ticket_lines.append(f"  • {med_name} x{quantity} - {unit_price:.2f} € chacun, total {total_price:.2f} €")
-            ticket_lines.append("")
-        ticket_lines.append(f"Total de la commande: {self._cart.get_total_price():.2f} €")
+        ticket_lines = self._service.build_ticket_lines(self._deliv_info, self._cart)
+        
+        # La commande est enregistrée (dans le journal, ou par le serveur) avant d'afficher le ticket
+        if self._cart.get_nb_med() > 0 and self._client is not None:
+            record = self._service.order_record(self._deliv_info, self._cart)
+            try:
+                # Commande du panier de la session, où le stock est déjà réservé (voir RemoteStock)
+                response = self._client.call("order", name=record['name'], first_name=record['first_name'],
+                                             date=record['date'])
+            except (ValueError, OSError) as error:
+                order_window.destroy()
+                self.notify(f"Commande refusée par le serveur : {error}", "error")
+                return
+            # Le ticket, les lignes et les prix sont ceux du serveur (qui a pu appliquer des prix plus récents)
+            ticket_lines = response['ticket']
+            record.update(items=response['items'], unit_prices_cents=response['unit_prices_cents'],
+                          total_cents=response['total_cents'])
+            if response['seq'] is not None:
+                order_window.title(f"Ticket de commande n°{response['seq'] + 1}")
+                self.record_stats(dict(record, seq=response['seq']), self._order_source)
+        elif self._cart.get_nb_med() > 0:
+            record = self._service.order_record(self._deliv_info, self._cart)
+            # Mêmes vérifications que le serveur et le traitement en lot (champs, date, pharmacies ouvertes)
+            try:
+                self._service.build_order(record)
+            except ValueError as error:
+                order_window.destroy()
+                self.notify(f"Commande impossible : {error}", "error")
+                return
+            seq = self._journal.append(record)
+            order_window.title(f"Ticket de commande n°{seq + 1}")
+            self.record_stats(dict(record, seq=seq))
+        if self._cart.get_nb_med() > 0:
+            # Commande passée : les réservations deviennent des ventes et le panier est vidé
+            self._stock.commit(self._cart)
+            self._cart.clear()
+            self.schedule_cart_repaint()
         
         ticket_text = "\n".join(ticket_lines)
         
@@ -581,6 +4088,40 @@ class MyPharmApp:
 
 # - Point d'entrée de l'application-
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = MyPharmApp(root)
-    root.mainloop()
+    # Usage : python script.py [--profile] [catalogue.db]
+    #         python script.py --export commandes.jsonl tickets.(txt|csv|json) [catalogue.db]
+    #         python script.py --generate catalogue.db nb_pharmacies nb_medicaments [graine]
+    #         python script.py --serve [catalogue.db] [--port N] [--journal commandes.journal] [--stocks stocks.csv]
+    #         python script.py --connect hôte:port
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        args = sys.argv[2:]
+        options = {}
+        for option in ("--port", "--journal", "--stocks"):
+            if option in args:
+                position = args.index(option)
+                options[option] = args[position + 1]
+                del args[position:position + 2]
+        run_server(CatalogStore(args[0]).load_pharmacies() if args else fake_pharmacies(),
+                   port=int(options.get("--port", 8765)), journal_path=options.get("--journal"),
+                   stock_path=options.get("--stocks"))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--connect":
+        host, _, port = sys.argv[2].rpartition(":")
+        root = tk.Tk()
+        app = MyPharmApp(root, server=(host or "127.0.0.1", int(port)))
+        root.mainloop()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--generate":
+        seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+        CatalogStore.write(sys.argv[2], generate_network(int(sys.argv[3]), int(sys.argv[4]), seed)).close()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--export":
+        with open(sys.argv[2], encoding="utf-8") as orders_file:
+            stats = export_tickets((json.loads(line) for line in orders_file if line.strip()), sys.argv[3],
+                                   catalog_path=sys.argv[4] if len(sys.argv) > 4 else None)
+        print(f"{stats['tickets']} tickets exportés ({stats['errors']} commandes invalides) "
+              f"en {stats['seconds']:.2f} s - {stats['tickets_per_second']:,.0f} tickets/s")
+    else:
+        args = sys.argv[1:]
+        profile = "--profile" in args
+        args = [arg for arg in args if arg != "--profile"]
+        root = tk.Tk()
+        app = MyPharmApp(root, args[0] if args else None, profile=profile)
+        root.mainloop()